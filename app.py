@@ -14,11 +14,21 @@ The planning process follows these stages:
 Key Components:
 - Stage: Enum tracking the current planning stage
 - Agents: Sommelier and Chef providing expert recommendations
-- CrewAI: Orchestrates the collaboration between agents
+- planner_core: Stages, agents, tasks and Batch API calls, shared with scripts/warm_cache.py
+- CrewAI: Defines the agents and the tasks they collaborate on
+- AsyncOpenAI: Runs each stage's task, streaming structured output as it arrives
 - Streamlit: Handles the web interface and user interactions
 
 Environment Variables:
     OPENAI_API_KEY: Required for AI agent functionality
+    DPP_CONCURRENCY: Maximum number of in-flight LLM requests for the stages users ask for,
+        shared by all sessions; speculative fetches have their own limit (default: 4)
+    DPP_PREFETCH: How many stages to fetch speculatively ahead of the user; 0 disables (default: 2)
+    DPP_PREFETCH_SCOPE: "all" options on screen, or only the "highlighted" one (default: all)
+    DPP_MENU_TREE: Set to 1 to speculate on the whole menu with one request (default: 0)
+    DPP_CACHE_PATH: SQLite file that keeps responses across restarts (default: .llm_cache.sqlite3)
+    DPP_SIMILARITY: How similar a wine must be to reuse its entrees; 0 disables (default: 0.92)
+    DPP_ANALYSIS_TIER: Service tier of the final menu analysis, e.g. auto (default: flex)
 """
 
 import os
@@ -26,34 +36,102 @@ import os
 os.environ["OTEL_PYTHON_DISABLED"] = "true"
 
 import streamlit as st
-from crewai import Agent, Task, Crew
-from openai import OpenAI
+from crewai import Task
+from openai import (
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    APIConnectionError,
+    APITimeoutError,
+    BadRequestError,
+    InternalServerError,
+    LengthFinishReasonError,
+    OpenAIError,
+    RateLimitError,
+)
 from dotenv import load_dotenv
-import json
-from enum import Enum
-from typing import List, Dict, Optional, Any, Union
+from pydantic import BaseModel
+import asyncio
+import concurrent.futures
+import functools
+import hashlib
+import logging
+import numpy as np
+import orjson
+import queue
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import closing
+from typing import List, Dict, Optional, Any, Union, Type, Callable, Awaitable, TypeVar
 from auth import check_authentication
+from planner_core import (
+    Stage,
+    SuggestionList,
+    MenuTree,
+    STAGE_RESPONSE_MODELS,
+    MODEL,
+    STAGE_MODELS,
+    MAX_TOKENS,
+    STAGE_MAX_TOKENS,
+    CONNECTION_LIMITS,
+    HTTP2,
+    BATCH_MAX_WAIT,
+    WARM_CACHE_PATH,
+    STAGE_TASK_TEMPLATES,
+    get_openai_client,
+    create_chef_agent,
+    create_crew_task,
+    create_stage_agent,
+    build_task_messages,
+    completion_params,
+    unwrap_structured_output,
+    run_stage_batch,
+    wine_names_match,
+)
+
+logger = logging.getLogger(__name__)
 
 # Constants and Configuration
-class Stage(str, Enum):
-    """
-    Tracks the current stage of dinner party planning.
-    
-    The stages must be completed in sequence:
-    WINE -> ENTREE -> APPETIZER -> DESSERT
-    
-    Each stage builds upon the selections made in previous stages to ensure
-    a cohesive dining experience.
-    """
-    WINE = 'wine'
-    ENTREE = 'entree'
-    APPETIZER = 'appetizer'
-    DESSERT = 'dessert'
-    FINAL = 'final'
+# OpenAI Configuration (the shared model settings live in planner_core)
+# The final analysis is not interactive, so it can wait on the cheaper "flex" tier
+# where the model offers it; see _run_stage_async for the fallback to "auto"
+STAGE_SERVICE_TIERS: Dict[Stage, str] = {
+    Stage.DESSERT: os.getenv("DPP_ANALYSIS_TIER", "flex"),
+}
+FLEX_TIMEOUT = 60.0  # Seconds a flex request may take before it is sent again on the default tier
+# Flex capacity is not guaranteed (429 "resource unavailable"), flex requests can
+# stall, and models without flex reject the tier outright
+FLEX_FALLBACK_ERRORS = (RateLimitError, APITimeoutError, BadRequestError)
+MENU_TREE_MAX_TOKENS = 2000  # A menu tree holds 18 suggestions
 
-# OpenAI Configuration
-MODEL = "gpt-3.5-turbo"  # Faster than GPT-4
-TEMPERATURE = 0.7  # Lower temperature for more focused responses
+# LLM Request Configuration
+MAX_CONCURRENCY = int(os.getenv("DPP_CONCURRENCY", "4"))  # In-flight limit for requested stages, across sessions
+MAX_ATTEMPTS = 3  # Attempts per request before giving up
+MAX_RETRY_DELAY = 30.0  # Seconds; caps both the backoff and the server's Retry-After
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+T = TypeVar("T")
+STREAM_POLL_INTERVAL = 0.05  # Seconds between checks for streamed partial results
+REQUEST_TIMEOUT = 180  # Seconds the page waits for a requested stage, retries included
+
+# Speculative Prefetch Configuration
+PREFETCH_DEPTH = int(os.getenv("DPP_PREFETCH", "2"))  # Stages fetched ahead of the user
+PREFETCH_HIGHLIGHTED_ONLY = os.getenv("DPP_PREFETCH_SCOPE", "all") == "highlighted"  # Skip options not in the picker
+MENU_TREE_PREFETCH = os.getenv("DPP_MENU_TREE", "0") == "1"  # One request instead of a stage per option
+PREFETCH_CONCURRENCY = 6  # In-flight request limit shared by all speculative fetches
+PREFETCH_WAIT_TIMEOUT = 30  # Seconds to wait on an unfinished speculative fetch before fetching directly
+
+# Persistent Response Cache Configuration
+RESPONSE_CACHE_PATH = os.getenv(
+    "DPP_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".llm_cache.sqlite3")
+)
+RESPONSE_CACHE_TTL = 86400  # Seconds a stored response stays valid (1 day)
+
+# Semantic Cache Configuration
+EMBEDDING_MODEL = "text-embedding-3-small"
+SIMILARITY_THRESHOLD = float(os.getenv("DPP_SIMILARITY", "0.92"))  # Cosine similarity for reusing another wine's entrees
 
 # Initialize environment and OpenAI client
 load_dotenv()
@@ -62,58 +140,43 @@ if not api_key:
     st.error("OpenAI API key not found. Please check your environment variables.")
     st.stop()
 
-try:
-    client = OpenAI(api_key=api_key)
-except Exception as e:
-    st.error(f"Error initializing OpenAI client: {str(e)}")
-    st.stop()
-
-# Agent Definitions
-def create_sommelier_agent() -> Agent:
+@st.cache_resource(show_spinner=False)
+def get_async_openai_client() -> AsyncOpenAI:
     """
-    Creates a Sommelier AI agent specialized in wine expertise.
+    Creates the asynchronous OpenAI client used for real-time requests.
     
-    The Sommelier agent provides:
-    - Wine characteristics and flavor profiles
-    - Food pairing suggestions
-    - Professional wine knowledge and recommendations
+    The client's connection pool is bound to the event loop it is first used on,
+    so it must only be used on the loop from get_background_loop.
     
     Returns:
-        Agent: Configured Sommelier agent with wine expertise
-    """
-    return Agent(
-        role='Expert Sommelier and Food Pairing Specialist',
-        goal='Help create perfect food and wine pairings',
-        backstory="""You are a renowned sommelier with decades of experience in wine
-        and food pairing. You have an encyclopedic knowledge of wines and their characteristics.""",
-        allow_delegation=True,  # Enable collaboration with Chef
-        verbose=True,  # Enable detailed logging
-        llm_model=MODEL,
-        temperature=TEMPERATURE
+        AsyncOpenAI: Shared client (retries are handled by _with_retry)
+    """
+    return AsyncOpenAI(
+        api_key=api_key,
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(http2=HTTP2, limits=CONNECTION_LIMITS)
     )
 
-def create_chef_agent() -> Agent:
+@st.cache_resource(show_spinner=False)
+def get_background_loop() -> asyncio.AbstractEventLoop:
     """
-    Creates a Chef AI agent specialized in culinary expertise.
+    Starts the event loop that runs all real-time LLM requests.
     
-    The Chef agent provides:
-    - Menu suggestions based on wine selection
-    - Flavor combinations and progression
-    - Professional culinary knowledge and techniques
+    The loop lives in a daemon thread, so its open connections and any
+    speculative fetches survive script reruns.
     
     Returns:
-        Agent: Configured Chef agent with culinary expertise
-    """
-    return Agent(
-        role='Expert Chef',
-        goal='Create delicious and harmonious menu combinations',
-        backstory="""You are an experienced chef with deep knowledge of flavors,
-        cooking techniques, and food pairings. You excel at creating cohesive menus.""",
-        allow_delegation=True,  # Enable collaboration with Sommelier
-        verbose=True,  # Enable detailed logging
-        llm_model=MODEL,
-        temperature=TEMPERATURE
-    )
+        asyncio.AbstractEventLoop: The running loop
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="llm-requests", daemon=True).start()
+    return loop
+
+try:
+    client = get_openai_client()
+except Exception as e:
+    st.error(f"Error initializing OpenAI client: {str(e)}")
+    st.stop()
 
 # Helper Functions
 def initialize_session_state():
@@ -133,303 +196,808 @@ def initialize_session_state():
         st.session_state.appetizer = None
     if 'dessert' not in st.session_state:
         st.session_state.dessert = None
+    if 'prefetched' not in st.session_state:
+        st.session_state.prefetched = {}
+    if 'batch_mode' not in st.session_state:
+        st.session_state.batch_mode = False
+
+def store_suggestions(course: str, suggestions: List[Dict]) -> None:
+    """
+    Stores a course's suggestions along with what its selection screen needs.
+    
+    The selection screen reruns on every widget interaction, so the options
+    lookup and the numbered list are built once here instead of on each rerun.
+    
+    Args:
+        course: Course the suggestions are for (entree, appetizer or dessert)
+        suggestions: Suggestions from the crew
+    """
+    st.session_state[f'{course}_suggestions'] = suggestions
+    st.session_state[f'{course}_options'] = {s['name']: s for s in suggestions}
+    st.session_state[f'{course}_display'] = format_suggestions(suggestions)
 
-def validate_suggestion_format(suggestion: Dict) -> bool:
+def format_suggestions(suggestions: List[Dict]) -> str:
     """
-    Validates that a suggestion dictionary has the required fields.
+    Formats suggestions as a numbered markdown list.
+    
+    Also used while suggestions stream in, so entries may still be missing
+    their description.
     
     Args:
-        suggestion: Dictionary containing the suggestion data
+        suggestions: Suggestions from the crew, possibly partial
     
     Returns:
-        bool: True if the suggestion is valid, False otherwise
+        str: One paragraph per suggestion
     """
-    return isinstance(suggestion, dict) and 'name' in suggestion and 'description' in suggestion
+    return "\n\n".join(
+        f"{i}. {s.get('name', '')}" + (f" - {s['description']}" if s.get('description') else "")
+        for i, s in enumerate(suggestions, 1)
+    )
 
-def validate_suggestions(suggestions: Any) -> tuple[bool, Optional[str]]:
+def stream_into(placeholder: Any) -> Callable[[List[Dict]], None]:
     """
-    Validates the suggestions data structure.
+    Creates a callback that shows streamed suggestions in a placeholder.
     
     Args:
-        suggestions: Suggestions data structure
+        placeholder: Element created with st.empty()
     
     Returns:
-        tuple: (is_valid: bool, error_message: Optional[str])
+        Callable[[List[Dict]], None]: Redraws the placeholder with the suggestions so far
     """
-    if not isinstance(suggestions, list):
-        return False, f"Invalid suggestions format - not a list. Got: {type(suggestions)}"
-        
-    if not suggestions:
-        return False, "Empty suggestions list"
-        
-    if not all(isinstance(s, dict) for s in suggestions):
-        return False, "Invalid suggestions format - not a list of dictionaries"
-        
-    if not all(validate_suggestion_format(s) for s in suggestions):
-        return False, "Invalid suggestions format - missing required fields"
-        
-    return True, None
+    return lambda suggestions: placeholder.markdown(format_suggestions(suggestions))
 
-def extract_json_from_response(response: str) -> Optional[str]:
+# Speculative whole-menu request (see prefetch_menu_tree)
+MENU_TREE_TEMPLATE = """For each of the entrees below, served with the wine below, suggest three
+                appetizers that lead into it and three desserts that follow it, keeping the entrees in order.
+                
+                Wine: {wine}
+                Entrees:
+                {entrees}"""
+
+def _retry_delay(error: Exception, attempt: int) -> float:
     """
-    Extracts JSON array or object from a response string.
+    Picks how long to wait before retrying a failed request.
+    
+    Honors the server's Retry-After header when there is one. Otherwise backs
+    off exponentially with jitter, so that the many speculative requests that
+    hit a rate limit together do not all retry at the same moment.
     
     Args:
-        response: The raw response string
+        error: The retryable error the attempt failed with
+        attempt: Zero-based number of the failed attempt
     
     Returns:
-        Optional[str]: The JSON string if found, None otherwise
-    """
-    # Look for Final Answer section in CrewAI output
-    final_answer_marker = "## Final Answer:"
-    if final_answer_marker in response:
-        response = response.split(final_answer_marker)[1].strip()
-    
-    # For array responses
-    array_start = response.find('[')
-    array_end = response.rfind(']') + 1
-    if array_start != -1 and array_end > array_start:
-        return response[array_start:array_end]
-        
-    # For object responses (used in final analysis)
-    obj_start = response.find('{')
-    obj_end = response.rfind('}') + 1
-    if obj_start != -1 and obj_end > obj_start:
-        return response[obj_start:obj_end]
-        
-    return None
+        float: Seconds to wait
+    """
+    response = getattr(error, "response", None)  # Connection errors have no response
+    if response is not None:
+        try:
+            if "retry-after-ms" in response.headers:
+                return min(float(response.headers["retry-after-ms"]) / 1000, MAX_RETRY_DELAY)
+            if "retry-after" in response.headers:
+                return min(float(response.headers["retry-after"]), MAX_RETRY_DELAY)
+        except ValueError:
+            pass  # An HTTP date rather than seconds; fall back to backoff
+    backoff = min(2 ** attempt, MAX_RETRY_DELAY)
+    return backoff / 2 + random.uniform(0, backoff / 2)
 
-def parse_crew_response(response: str, expect_analysis: bool = False) -> Optional[Union[List[Dict], Dict]]:
+async def _with_retry(request: Callable[[], Awaitable[T]]) -> T:
     """
-    Parses and validates the crew's response.
+    Awaits an API request, retrying transient failures.
+    
+    Retries rate limits, connection errors and server errors up to
+    MAX_ATTEMPTS attempts, waiting as long as _retry_delay suggests.
     
     Args:
-        response: Raw response string from the crew
-        expect_analysis: If True, expect a single JSON object instead of an array
+        request: Creates a fresh request coroutine for each attempt
     
     Returns:
-        Optional[Union[List[Dict], Dict]]: Parsed and validated response
+        The result of the first successful attempt
+    """
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            return await request()
+        except RETRYABLE_ERRORS as e:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            await asyncio.sleep(_retry_delay(e, attempt))
+
+async def _parse_completion(
+    async_client: AsyncOpenAI,
+    semaphore: asyncio.Semaphore,
+    messages: List[Dict[str, str]],
+    response_model: Type[BaseModel],
+    on_partial: Optional[Callable[[Dict], None]] = None,
+    model: str = MODEL,
+    max_tokens: int = MAX_TOKENS,
+    service_tier: Optional[str] = None
+) -> BaseModel:
+    """
+    Requests a chat completion constrained to a response model's JSON schema.
+    
+    Structured outputs guarantee the response parses into the model, so no
+    JSON extraction or validation is needed afterwards. When `on_partial` is
+    given the response is streamed, and every chunk reports the partially
+    parsed JSON received so far.
+    
+    Args:
+        async_client: Client used to issue the request
+        semaphore: Limits the number of in-flight requests
+        messages: Chat messages to send
+        response_model: Pydantic model describing the expected output
+        on_partial: Receives the partial response as a dict after each chunk
+        model: Model to use
+        max_tokens: Cap on the response length
+        service_tier: Processing tier, or None for the account default
+    
+    Returns:
+        BaseModel: The parsed response
+    
+    Raises:
+        ValueError: If the model refused to answer or ran out of tokens
     """
-    json_str = extract_json_from_response(response)
-    if not json_str:
-        st.error("Failed to find JSON in response. Response: " + response[:200] + "...")
-        return None
-        
     try:
-        parsed = json.loads(json_str)
-        
-        if expect_analysis:
-            if not isinstance(parsed, dict):
-                st.error(f"Expected analysis object but got: {type(parsed)}")
-                return None
-            
-            # Check for required top-level keys
-            required_keys = ["wine_pairing", "flavor_progression", "highlights", "overall_harmony"]
-            if not all(key in parsed for key in required_keys):
-                st.error(f"Analysis is missing required fields. Expected: {required_keys}")
-                return None
-                
-            # Convert nested structures to flat format if needed
-            if isinstance(parsed["wine_pairing"], dict):
-                # Extract main wine pairing text from nested structure
-                wine_pairing = parsed["wine_pairing"]
-                wine_text = []
-                if "appetizer_pairing" in wine_pairing:
-                    wine_text.append(f"Appetizer: {wine_pairing['appetizer_pairing']['description']}")
-                if "entree_pairing" in wine_pairing:
-                    wine_text.append(f"Entree: {wine_pairing['entree_pairing']['description']}")
-                if "dessert_pairing" in wine_pairing:
-                    wine_text.append(f"Dessert: {wine_pairing['dessert_pairing']['description']}")
-                parsed["wine_pairing"] = "\n".join(wine_text)
-            
-            # Convert nested flavor progression if needed
-            if isinstance(parsed["flavor_progression"], dict):
-                progression = parsed["flavor_progression"]
-                parsed["flavor_progression"] = "\n".join([
-                    f"Appetizer: {progression.get('appetizer', '')}",
-                    f"Entree: {progression.get('entree', '')}",
-                    f"Dessert: {progression.get('dessert', '')}"
-                ])
-            
-            # Convert nested highlights if needed
-            if isinstance(parsed["highlights"], dict):
-                highlights = parsed["highlights"]
-                all_highlights = []
-                if "notable_combinations" in highlights:
-                    all_highlights.extend(highlights["notable_combinations"])
-                if "standout_elements" in highlights:
-                    all_highlights.extend(highlights["standout_elements"])
-                parsed["highlights"] = all_highlights
-            
-            return parsed
-            
-        is_valid, error_msg = validate_suggestions(parsed)
-        if not is_valid:
-            st.error(error_msg)
-            st.error("Raw JSON: " + json_str[:200] + "...")
-            return None
-            
-        return parsed
-        
-    except json.JSONDecodeError as e:
-        st.error(f"Failed to parse JSON: {str(e)}")
-        st.error("Problematic JSON string: " + json_str[:200] + "...")
-        return None
+        async with semaphore:
+            if on_partial is None:
+                completion = await async_client.beta.chat.completions.parse(
+                    messages=messages,
+                    response_format=response_model,
+                    **completion_params(model=model, max_tokens=max_tokens, service_tier=service_tier)
+                )
+            else:
+                async with async_client.beta.chat.completions.stream(
+                    messages=messages,
+                    response_format=response_model,
+                    **completion_params(model=model, max_tokens=max_tokens, service_tier=service_tier)
+                ) as stream:
+                    async for event in stream:
+                        if event.type == "content.delta" and isinstance(event.parsed, dict):
+                            on_partial(event.parsed)
+                    completion = await stream.get_final_completion()
+    except LengthFinishReasonError:
+        # Not retried: the same request would be cut off again
+        logger.error("%s response from %s was cut off at %d tokens", response_model.__name__, model, max_tokens)
+        raise ValueError(f"The response was cut off at {max_tokens} tokens before it was complete")
+    message = completion.choices[0].message
+    if message.parsed is None:
+        raise ValueError(f"The model declined to respond: {message.refusal}")
+    return message.parsed
 
-def create_crew_tasks(stage: Stage, **kwargs) -> List[Task]:
+async def _run_stage_async(
+    stage: Stage,
+    async_client: AsyncOpenAI,
+    semaphore: asyncio.Semaphore,
+    on_partial: Optional[Callable[[List[Dict]], None]] = None,
+    **kwargs
+) -> Optional[Union[List[Dict], Dict]]:
     """
-    Creates tasks for the AI crew based on the current planning stage.
+    Runs the crew task for a stage directly against the OpenAI API.
     
-    Each stage requires different expertise and considerations:
-    - WINE: Initial wine analysis
-    - ENTREE: Main course suggestions based on wine
-    - APPETIZER: Starter suggestions complementing wine and entree
-    - DESSERT: Dessert suggestions and final menu analysis
+    The task uses structured outputs, so its result needs no further parsing.
     
     Args:
         stage: Current stage of dinner planning
+        async_client: Client used to issue the requests
+        semaphore: Shared request limit (see get_request_semaphore and get_prefetch_semaphore)
+        on_partial: Receives the suggestions parsed so far while the response streams
         **kwargs: Stage-specific parameters
-            - wine: str - Selected wine (required for all stages)
-            - entree: str - Selected entree (required for appetizer/dessert)
-            - appetizer: str - Selected appetizer (required for dessert)
     
     Returns:
-        List[Task]: Tasks for the AI crew to execute
+        Optional[Union[List[Dict], Dict]]: Suggestions, or the menu analysis for the DESSERT stage
     """
-    sommelier = create_sommelier_agent()
-    chef = create_chef_agent()
+    task = create_crew_task(stage, **kwargs)
+    if task is None:
+        return None
     
-    if stage == Stage.WINE:
-        return [
-            Task(
-                description=f"Analyze {kwargs['wine']} and provide its key characteristics and flavor profile. Consider body, tannins, acidity, and primary flavors. Format your response as a JSON string containing an array of wine characteristics.",
-                agent=sommelier,
-                expected_output="A JSON object containing wine characteristics. Expected keys: \n- 'name': (string) The name of the wine.\n- 'body': (string) The body of the wine (e.g., light, medium, full).\n- 'tannins': (string) Description of tannins (e.g., low, medium, high).\n- 'acidity': (string) Description of acidity (e.g., low, medium, high).\n- 'flavors': (array of strings) List of primary flavors."
-            ),
-            Task(
-                description=f"""Based on the wine analysis, suggest three dinner entrees.
-                You MUST format your response as a JSON array of objects with 'name' and 'description' fields.
-                Do not include any other text before or after the JSON array.
-                Example:
-                [
-                    {{"name": "Grilled Ribeye Steak", 
-                      "description": "Pan-seared to develop a caramelized crust, complementing the wine's structure"}},
-                    {{"name": "Braised Lamb Shanks", 
-                      "description": "Slow-cooked with herbs to match the wine's complexity"}},
-                    {{"name": "Duck Breast", 
-                      "description": "Crispy skin and medium-rare meat to balance the wine's characteristics"}}
-                ]""",
-                agent=chef,
-                expected_output="A JSON array of objects representing entree suggestions. Each object should have: \n- 'name': (string) The name of the entree.\n- 'description': (string) A description of the entree."
-            )
-        ]
-    elif stage == Stage.ENTREE:
-        return [
-            Task(
-                description=f"Analyze how the appetizer should complement both {kwargs['wine']} and {kwargs['entree']}. Consider progression of flavors through the meal.",
-                agent=sommelier,
-                expected_output="Analysis of how the appetizer complements the wine and entree. Expected keys: \n- 'analysis': (string) Detailed description of the pairing"
-            ),
-            Task(
-                description=f"Based on the sommelier's analysis, suggest three appetizers that create a harmonious progression to {kwargs['entree']}.",
-                agent=chef,
-                expected_output="A JSON array of objects representing appetizer suggestions. Each object should have: \n- 'name': (string) The name of the appetizer.\n- 'description': (string) A description of the appetizer."
+    model = STAGE_MODELS.get(stage, MODEL)
+    stream_partial = None
+    if on_partial is not None and STAGE_RESPONSE_MODELS[stage] is SuggestionList:
+        stream_partial = lambda parsed: on_partial(parsed.get("suggestions") or [])
+    messages = build_task_messages(task)
+    request = lambda client, service_tier: _parse_completion(
+        client, semaphore, messages, STAGE_RESPONSE_MODELS[stage], stream_partial, model,
+        max_tokens=STAGE_MAX_TOKENS.get(stage, MAX_TOKENS),
+        service_tier=service_tier
+    )
+    service_tier = STAGE_SERVICE_TIERS.get(stage)
+    flex_unsupported = get_flex_unsupported_models()
+    if service_tier == "flex" and model not in flex_unsupported:
+        # One flex attempt; waiting out its backoff would cost more time than the default tier
+        try:
+            return unwrap_structured_output(
+                await request(async_client.with_options(timeout=FLEX_TIMEOUT), "flex")
             )
-        ]
-    elif stage == Stage.APPETIZER:
-        return [
-            Task(
-                description=f"Analyze how the dessert should complement both {kwargs['wine']} and {kwargs['entree']}. Consider progression of flavors through the meal.",
-                agent=sommelier,
-                expected_output="Analysis of how the dessert complements the wine and entree. Expected keys: \n- 'analysis': (string) Detailed description of the pairing."
-            ),
-            Task(
-                description=f"Based on the sommelier's analysis, suggest three desserts that create a harmonious progression to {kwargs['entree']}.",
-                agent=chef,
-                expected_output="A JSON array of objects representing dessert suggestions. Each object should have: \n- 'name': (string) The name of the dessert.\n- 'description': (string) A description of the dessert."
+        except FLEX_FALLBACK_ERRORS as e:
+            logger.warning("Flex request for %s failed (%s); using the default tier", stage.value, e)
+            if isinstance(e, BadRequestError):
+                flex_unsupported.add(model)
+    if service_tier == "flex":
+        service_tier = "auto"
+    result = await _with_retry(lambda: request(async_client, service_tier))
+    return unwrap_structured_output(result)
+
+@st.cache_resource(show_spinner=False)
+def get_flex_unsupported_models() -> set:
+    """
+    Creates the process-wide set of models that rejected the flex tier.
+    
+    Returns:
+        set: Models whose requests go straight to the default tier
+    """
+    return set()
+
+@st.cache_resource(show_spinner=False)
+def get_cache_stats() -> Counter:
+    """
+    Creates the process-wide counts of response cache hits and misses.
+    
+    Returns:
+        Counter: Counts under "hits" and "misses"
+    """
+    return Counter()
+
+@st.cache_resource(show_spinner=False)
+def load_warm_cache() -> Dict[str, List[Dict]]:
+    """
+    Loads the entree suggestions precomputed by scripts/warm_cache.py.
+    
+    Returns:
+        Dict[str, List[Dict]]: Suggestions keyed by lowercased wine name (empty if never warmed)
+    """
+    try:
+        with open(WARM_CACHE_PATH, "rb") as f:
+            warm = orjson.loads(f.read())
+    except FileNotFoundError:
+        return {}
+    return {wine.strip().lower(): suggestions for wine, suggestions in warm.items()}
+
+@functools.lru_cache(maxsize=None)
+def _stage_prompt_version(stage: Stage) -> str:
+    """
+    Fingerprints the parts of a stage's request that do not depend on the selections.
+    
+    Covers the task template, the agent's prompt and the response schema, so
+    editing any of them stops older stored responses from being served.
+    
+    Args:
+        stage: Current stage of dinner planning
+    
+    Returns:
+        str: Hex digest of the stage's prompt and schema
+    """
+    template = STAGE_TASK_TEMPLATES.get(stage)
+    if template is None:
+        return ""
+    agent = create_stage_agent(template)
+    fingerprint = orjson.dumps(
+        {
+            "template": template,
+            "agent": [agent.role, agent.goal, agent.backstory],
+            "schema": STAGE_RESPONSE_MODELS[stage].model_json_schema(),
+        },
+        option=orjson.OPT_SORT_KEYS
+    )
+    return hashlib.sha256(fingerprint).hexdigest()
+
+def _response_cache_key(stage: Stage, kwargs_json: str) -> str:
+    """
+    Derives the persistent cache key for a stage request.
+    
+    The key covers everything that shapes the prompt: the model, the stage, the
+    prompt and schema version and every prior selection.
+    
+    Args:
+        stage: Current stage of dinner planning
+        kwargs_json: Stage-specific parameters serialized with sorted keys
+    
+    Returns:
+        str: Hex digest identifying the request
+    """
+    model = STAGE_MODELS.get(stage, MODEL)
+    version = _stage_prompt_version(stage)
+    return hashlib.sha256(f"{model}:{stage.value}:{version}:{kwargs_json}".encode()).hexdigest()
+
+def _connect_response_cache() -> sqlite3.Connection:
+    """
+    Opens the persistent response cache, creating it on first use.
+    
+    Returns:
+        sqlite3.Connection: Connection in autocommit mode
+    """
+    connection = sqlite3.connect(RESPONSE_CACHE_PATH, isolation_level=None)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value BLOB NOT NULL, created REAL NOT NULL)"
+    )
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS wine_embeddings (wine TEXT PRIMARY KEY, embedding BLOB NOT NULL, created REAL NOT NULL)"
+    )
+    return connection
+
+def load_cached_response(stage: Stage, kwargs_json: str) -> Optional[Union[List[Dict], Dict]]:
+    """
+    Looks up a stored response that has not expired.
+    
+    Args:
+        stage: Current stage of dinner planning
+        kwargs_json: Stage-specific parameters serialized with sorted keys
+    
+    Returns:
+        Optional[Union[List[Dict], Dict]]: The stored response, or None on a miss
+    """
+    try:
+        with closing(_connect_response_cache()) as connection:
+            row = connection.execute(
+                "SELECT value FROM responses WHERE key = ? AND created > ?",
+                (_response_cache_key(stage, kwargs_json), time.time() - RESPONSE_CACHE_TTL)
+            ).fetchone()
+    except sqlite3.Error:
+        return None  # The cache is an optimization; never fail a request over it
+    return orjson.loads(row[0]) if row else None
+
+def store_cached_response(stage: Stage, kwargs_json: str, response: Union[List[Dict], Dict]) -> None:
+    """
+    Stores a validated response so later sessions and restarts can reuse it.
+    
+    Args:
+        stage: Current stage of dinner planning
+        kwargs_json: Stage-specific parameters serialized with sorted keys
+        response: Suggestions or menu analysis to store
+    """
+    try:
+        with closing(_connect_response_cache()) as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                (_response_cache_key(stage, kwargs_json), orjson.dumps(response), time.time())
             )
-        ]
-    elif stage == Stage.DESSERT:
-        return [
-            Task(
-                description=f"""Analyze how the following menu components will interact together and return ONLY a JSON object with NO additional text:
-                Wine: {kwargs['wine']}
-                Appetizer: {kwargs['appetizer']} ({kwargs['appetizer_description']})
-                Entree: {kwargs['entree']} ({kwargs['entree_description']})
-                Dessert: {kwargs['dessert']} ({kwargs['dessert_description']})
-                
-                The response must be a valid JSON object with exactly this structure:
-                {{
-                    "wine_pairing": "Detailed analysis of how the wine pairs with each course",
-                    "flavor_progression": "Analysis of how flavors progress through the meal",
-                    "highlights": "Notable flavor combinations and standout elements",
-                    "overall_harmony": "Assessment of how well the entire menu works together"
-                }}
-                """,
-                agent=sommelier,
-                expected_output="A JSON object containing the menu analysis with required fields: wine_pairing, flavor_progression, highlights, overall_harmony"
+    except sqlite3.Error:
+        pass
+
+def embed_wine(wine: str) -> Optional[np.ndarray]:
+    """
+    Embeds a wine name for the semantic cache.
+    
+    Args:
+        wine: Wine as typed by the user
+    
+    Returns:
+        Optional[np.ndarray]: Unit-length float32 embedding, or None if the request failed
+    """
+    try:
+        response = client.embeddings.create(model=EMBEDDING_MODEL, input=wine)
+    except OpenAIError:
+        return None  # Fall back to asking the crew
+    embedding = np.asarray(response.data[0].embedding, dtype=np.float32)
+    return embedding / np.linalg.norm(embedding)
+
+def find_similar_wine(wine: str, embedding: np.ndarray) -> Optional[str]:
+    """
+    Finds the stored wine closest to an embedding, if it is close enough.
+    
+    Only stored wines with the same words in their name are candidates (see
+    wine_names_match), since similar embeddings can still be different
+    vintages or regions. The candidates' embeddings are compared in a single
+    matrix product.
+    
+    Args:
+        wine: Wine being looked up, as typed by the user
+        embedding: Unit-length embedding of the wine
+    
+    Returns:
+        Optional[str]: The most similar wine above SIMILARITY_THRESHOLD, or None
+    """
+    try:
+        with closing(_connect_response_cache()) as connection:
+            rows = connection.execute(
+                "SELECT wine, embedding FROM wine_embeddings WHERE created > ?",
+                (time.time() - RESPONSE_CACHE_TTL,)
+            ).fetchall()
+    except sqlite3.Error:
+        return None
+    
+    # Embeddings from another model have another size and cannot be compared
+    rows = [
+        (stored, blob) for stored, blob in rows
+        if len(blob) == embedding.nbytes and wine_names_match(wine, stored)
+    ]
+    if not rows:
+        return None
+    matrix = np.frombuffer(b"".join(blob for _, blob in rows), dtype=np.float32).reshape(len(rows), -1)
+    similarities = matrix @ embedding
+    best = int(np.argmax(similarities))
+    return rows[best][0] if similarities[best] >= SIMILARITY_THRESHOLD else None
+
+def store_wine_embedding(wine: str, embedding: np.ndarray) -> None:
+    """
+    Stores a wine's embedding once its entrees are in the response cache.
+    
+    Args:
+        wine: Wine as typed by the user
+        embedding: Unit-length embedding of the wine
+    """
+    try:
+        with closing(_connect_response_cache()) as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO wine_embeddings (wine, embedding, created) VALUES (?, ?, ?)",
+                (wine, embedding.tobytes(), time.time())
             )
-        ]
-    return []
+    except sqlite3.Error:
+        pass
 
-@st.cache_data(ttl=3600, show_spinner=False)  # Cache responses for 1 hour, hide the spinner
-def get_cached_suggestions(stage: Stage, **kwargs) -> Optional[List[Dict]]:
+def get_cached_suggestions(
+    stage: Stage,
+    use_batch: bool = False,
+    on_partial: Optional[Callable[[List[Dict]], None]] = None,
+    **kwargs
+) -> Optional[List[Dict]]:
     """
     Cached version of get_crew_suggestions to improve response time.
     
+    Answers from the warmed entree suggestions or the persistent response
+    cache before calling the crew. A wine that misses the cache can still
+    reuse the entrees of a differently worded wine with a similar embedding
+    and the same words in its name (e.g. "cab sauv" and "Cabernet Sauvignon"). Only validated responses are
+    stored, so a failed request is retried on the next attempt.
+    
     Args:
         stage: Current stage of dinner planning
+        use_batch: Route the request through the Batch API (not part of the cache key)
+        on_partial: Receives partial suggestions while they stream
         **kwargs: Stage-specific parameters
         
     Returns:
         Optional[List[Dict]]: Cached suggestions from the crew
     """
-    # Convert kwargs to a string for hashing
-    kwargs_str = json.dumps(kwargs, sort_keys=True)
-    return get_crew_suggestions(stage, **kwargs)
+    if stage == Stage.WINE:
+        warm = load_warm_cache().get(kwargs['wine'].strip().lower())
+        if warm:
+            get_cache_stats()["hits"] += 1
+            return warm
+    
+    kwargs_json = _serialize_kwargs(kwargs)
+    cached = load_cached_response(stage, kwargs_json)
+    if cached is not None:
+        get_cache_stats()["hits"] += 1
+        return cached
+    
+    embedding = None
+    if stage == Stage.WINE and SIMILARITY_THRESHOLD > 0:
+        embedding = embed_wine(kwargs['wine'])
+        similar_wine = find_similar_wine(kwargs['wine'], embedding) if embedding is not None else None
+        if similar_wine is not None:
+            cached = load_cached_response(stage, _serialize_kwargs({'wine': similar_wine}))
+            if cached is not None:
+                store_cached_response(stage, kwargs_json, cached)  # Skip the embedding next time
+                get_cache_stats()["hits"] += 1
+                return cached
+    
+    get_cache_stats()["misses"] += 1
+    suggestions = get_crew_suggestions(stage, use_batch=use_batch, on_partial=on_partial, **kwargs)
+    if suggestions:
+        store_cached_response(stage, kwargs_json, suggestions)
+        if embedding is not None:
+            store_wine_embedding(kwargs['wine'], embedding)
+    return suggestions
+
+def _serialize_kwargs(kwargs: Dict[str, Any]) -> str:
+    """
+    Serializes stage parameters into a deterministic cache key.
+    
+    Args:
+        kwargs: Stage-specific parameters
+    
+    Returns:
+        str: JSON with sorted keys
+    """
+    return orjson.dumps(kwargs, option=orjson.OPT_SORT_KEYS).decode()
+
+@st.cache_resource(show_spinner=False)
+def get_request_semaphore() -> asyncio.Semaphore:
+    """
+    Creates the request limit shared by every stage the user asks for, across all sessions.
+    
+    Returns:
+        asyncio.Semaphore: Allows MAX_CONCURRENCY requests in flight
+    """
+    return asyncio.Semaphore(MAX_CONCURRENCY)
 
-def get_crew_suggestions(stage: Stage, **kwargs) -> Optional[List[Dict]]:
+@st.cache_resource(show_spinner=False)
+def get_prefetch_semaphore() -> asyncio.Semaphore:
+    """
+    Creates the request limit shared by all speculative fetches.
+    
+    Returns:
+        asyncio.Semaphore: Allows PREFETCH_CONCURRENCY requests in flight
+    """
+    return asyncio.Semaphore(PREFETCH_CONCURRENCY)
+
+# Parameters for the next stage, given a stage's parameters and one of its suggestions.
+# The final analysis also needs the dishes' descriptions, so it is only
+# speculated from the dessert screen.
+NEXT_STAGE_PARAMS: Dict[Stage, tuple[Stage, Callable[[Dict[str, Any], Dict], Dict[str, Any]]]] = {
+    Stage.WINE: (Stage.ENTREE, lambda kwargs, suggestion: {**kwargs, 'entree': suggestion['name']}),
+    Stage.ENTREE: (Stage.APPETIZER, lambda kwargs, suggestion: {**kwargs, 'appetizer': suggestion['name']}),
+}
+
+def prefetch_suggestions(stage: Stage, candidates: List[Dict[str, Any]]) -> None:
+    """
+    Speculatively starts fetching a stage for every option the user may pick.
+    
+    Fetches run in the background while the user reads the current suggestions,
+    and get_suggestions picks up the result for whichever option is chosen.
+    With a PREFETCH_DEPTH above 1, each finished fetch goes on to speculate on
+    its own suggestions in turn.
+    
+    Does nothing when PREFETCH_HIGHLIGHTED_ONLY is set; prefetch_highlighted
+    then fetches only the option the user is looking at.
+    
+    Args:
+        stage: Stage to fetch ahead of time
+        candidates: Stage-specific parameters for each option on screen
+    """
+    if PREFETCH_HIGHLIGHTED_ONLY:
+        return
+    for kwargs in candidates:
+        _start_prefetch(st.session_state.prefetched, stage, kwargs, PREFETCH_DEPTH)
+
+def prefetch_highlighted(stage: Stage, kwargs: Dict[str, Any]) -> None:
+    """
+    Speculatively fetches a stage for the option currently shown in a picker.
+    
+    Called on every rerun of a picker fragment, so the fetch starts as soon as
+    the user highlights an option. Already prefetched options are skipped,
+    which makes this a fallback for any option the broad prefetch missed.
+    
+    Args:
+        stage: Stage to fetch ahead of time
+        kwargs: Stage-specific parameters for the highlighted option
+    """
+    _start_prefetch(st.session_state.prefetched, stage, kwargs, min(PREFETCH_DEPTH, 1))
+
+def prefetch_next_stage(stage: Stage, kwargs: Dict[str, Any], suggestions: List[Dict]) -> None:
+    """
+    Speculatively starts the stage that follows each of a stage's suggestions.
+    
+    Args:
+        stage: Stage whose suggestions are on screen
+        kwargs: Parameters the suggestions were fetched with
+        suggestions: Suggestions the user is choosing from
+    """
+    next_stage, next_params = NEXT_STAGE_PARAMS[stage]
+    prefetch_suggestions(next_stage, [next_params(kwargs, suggestion) for suggestion in suggestions])
+
+def _start_prefetch(prefetched: Dict, stage: Stage, kwargs: Dict[str, Any], depth: int) -> None:
+    """
+    Schedules one speculative fetch unless it is already running.
+    
+    Safe to call from the background loop, which is why the session's
+    `prefetched` dict is passed in rather than read from session_state.
+    The response cache is checked by the fetch itself, off the loop.
+    
+    Args:
+        prefetched: Futures of the session's speculative fetches
+        stage: Stage to fetch
+        kwargs: Stage-specific parameters
+        depth: Remaining number of stages to speculate on
+    """
+    if depth < 1:
+        return
+    kwargs_json = _serialize_kwargs(kwargs)
+    key = (stage.value, kwargs_json)
+    if key not in prefetched:
+        prefetched[key] = asyncio.run_coroutine_threadsafe(
+            _speculate(prefetched, stage, kwargs, depth), get_background_loop()
+        )
+
+async def _speculate(
+    prefetched: Dict,
+    stage: Stage,
+    kwargs: Dict[str, Any],
+    depth: int
+) -> Optional[Union[List[Dict], Dict]]:
+    """
+    Runs a speculative fetch, then speculates on each of its suggestions.
+    
+    Stages already in the response cache are left to get_suggestions, which
+    reads them from there.
+    
+    Args:
+        prefetched: Futures of the session's speculative fetches
+        stage: Stage to fetch
+        kwargs: Stage-specific parameters
+        depth: Remaining number of stages to speculate on, including this one
+    
+    Returns:
+        Optional[Union[List[Dict], Dict]]: Suggestions, or the menu analysis for the DESSERT stage
+            (None if the response is cached)
+    """
+    # SQLite blocks, so the lookup runs in a worker thread rather than on the loop
+    if await asyncio.to_thread(load_cached_response, stage, _serialize_kwargs(kwargs)) is not None:
+        return None
+    result = await _run_stage_async(
+        stage, get_async_openai_client(), semaphore=get_prefetch_semaphore(), **kwargs
+    )
+    if result and stage in NEXT_STAGE_PARAMS:
+        next_stage, next_params = NEXT_STAGE_PARAMS[stage]
+        for suggestion in result:
+            _start_prefetch(prefetched, next_stage, next_params(kwargs, suggestion), depth - 1)
+    return result
+
+def prefetch_menu_tree(wine: str, entrees: List[Dict]) -> None:
+    """
+    Speculates on every entree's appetizers and desserts with a single request.
+    
+    Used instead of fetching a stage per option when MENU_TREE_PREFETCH is set.
+    The chef plans appetizers and desserts for all entrees at once, and
+    desserts are matched to the entree only. The
+    results fill the same `prefetched` slots get_suggestions reads from.
+    
+    Args:
+        wine: Selected wine
+        entrees: Entree suggestions the user is choosing from
+    """
+    if PREFETCH_DEPTH < 1:
+        return
+    
+    prefetched = st.session_state.prefetched
+    slots = []
+    for entree in entrees:
+        key = (Stage.ENTREE.value, _serialize_kwargs({'wine': wine, 'entree': entree['name']}))
+        slot = concurrent.futures.Future()
+        prefetched.setdefault(key, slot)
+        slots.append(slot)
+    
+    messages = build_task_messages(
+        Task(
+            description=MENU_TREE_TEMPLATE.format(
+                wine=wine, entrees="\n".join(f"- {entree['name']}" for entree in entrees)
+            ),
+            agent=create_chef_agent(),
+            expected_output="Three appetizers and three desserts for each entree."
+        )
+    )
+    asyncio.run_coroutine_threadsafe(
+        _speculate_menu_tree(prefetched, wine, entrees, messages, slots), get_background_loop()
+    )
+
+async def _speculate_menu_tree(
+    prefetched: Dict,
+    wine: str,
+    entrees: List[Dict],
+    messages: List[Dict[str, str]],
+    slots: List[concurrent.futures.Future]
+) -> None:
+    """
+    Requests the menu tree and resolves the prefetch slots from it.
+    
+    Args:
+        prefetched: Futures of the session's speculative fetches
+        wine: Selected wine
+        entrees: Entree suggestions the tree was requested for
+        messages: Chat messages asking for the tree
+        slots: Unresolved appetizer futures, one per entree
+    """
+    try:
+        tree = await _with_retry(lambda: _parse_completion(
+            get_async_openai_client(), get_prefetch_semaphore(), messages, MenuTree,
+            max_tokens=MENU_TREE_MAX_TOKENS
+        ))
+        
+        # Courses follow the order of the entrees; a short tree leaves the rest to a regular fetch
+        for index, (entree, slot) in enumerate(zip(entrees, slots)):
+            if slot.cancelled():
+                continue  # get_suggestions gave up waiting on it
+            if index >= len(tree.courses):
+                slot.set_result(None)
+                continue
+            course = tree.courses[index]
+            appetizers = [appetizer.model_dump() for appetizer in course.appetizers]
+            desserts = [dessert.model_dump() for dessert in course.desserts]
+            slot.set_result(appetizers)
+            for appetizer in appetizers:
+                kwargs = {'wine': wine, 'entree': entree['name'], 'appetizer': appetizer['name']}
+                desserts_slot = concurrent.futures.Future()
+                desserts_slot.set_result(desserts)
+                prefetched.setdefault((Stage.APPETIZER.value, _serialize_kwargs(kwargs)), desserts_slot)
+    except Exception as e:
+        # Every slot must resolve, or get_suggestions would wait on it
+        for slot in slots:
+            if not slot.done():
+                slot.set_exception(e)
+
+def get_suggestions(
+    stage: Stage,
+    use_batch: bool = False,
+    on_partial: Optional[Callable[[List[Dict]], None]] = None,
+    **kwargs
+) -> Optional[Union[List[Dict], Dict]]:
+    """
+    Gets suggestions for a stage, preferring a speculative fetch if one was started.
+    
+    Args:
+        stage: Current stage of dinner planning
+        use_batch: Fetch through the Batch API if nothing was prefetched
+        on_partial: Receives partial suggestions if they have to be fetched now
+        **kwargs: Stage-specific parameters
+    
+    Returns:
+        Optional[Union[List[Dict], Dict]]: Suggestions, or the menu analysis for the DESSERT stage
+    """
+    kwargs_json = _serialize_kwargs(kwargs)
+    key = (stage.value, kwargs_json)
+    future = st.session_state.prefetched.get(key)
+    if future is not None:
+        try:
+            result = future.result(timeout=PREFETCH_WAIT_TIMEOUT)
+            if result:
+                store_cached_response(stage, kwargs_json, result)
+                return result
+        except TimeoutError:
+            # The speculative fetch is stuck; stop it and fetch directly instead
+            future.cancel()
+            st.session_state.prefetched.pop(key, None)
+        except Exception:
+            pass  # Fall back to a regular fetch, which reports the error
+    return get_cached_suggestions(stage, use_batch=use_batch, on_partial=on_partial, **kwargs)
+
+def get_crew_suggestions(
+    stage: Stage,
+    use_batch: bool = False,
+    on_partial: Optional[Callable[[List[Dict]], None]] = None,
+    **kwargs
+) -> Optional[List[Dict]]:
     """
     Gets suggestions (e.g., entree, appetizer, dessert) from the crew for the current stage.
     
     Args:
         stage: Current stage of dinner planning
+        use_batch: Use the cheaper, slower Batch API instead of real-time requests,
+            falling back to them if the batch takes longer than BATCH_MAX_WAIT
+        on_partial: Called on this thread with the suggestions parsed so far while they stream
         **kwargs: Stage-specific parameters
     
     Returns:
         Optional[List[Dict]]: Suggestions from the crew
     """
-    tasks = create_crew_tasks(stage, **kwargs)
-    if not tasks:
-        return None
-        
     try:
-        crew = Crew(
-            agents=[create_sommelier_agent(), create_chef_agent()],
-            tasks=tasks,
-            verbose=True,  # Enable detailed logging
-            process_timeout=300  # 5 minute timeout
-        )
-        result = crew.kickoff()
+        if use_batch:
+            try:
+                suggestions = run_stage_batch(stage, **kwargs)
+                if suggestions is None:
+                    st.error("The batch response was incomplete or not in the expected format. Please try again.")
+                return suggestions
+            except TimeoutError:
+                pass  # The batch was cancelled; ask in real time instead
         
-        # Extract the raw output from CrewOutput object
-        if hasattr(result, 'raw_output'):
-            response_text = str(result.raw_output)
-        else:
-            response_text = str(result)  # Fallback to string representation
-            
-        return parse_crew_response(
-            response=response_text,
-            expect_analysis=(stage == Stage.DESSERT)
+        # Partial results arrive on the background loop; hand them over so
+        # on_partial can draw on this script thread
+        updates: queue.Queue = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            _run_stage_async(
+                stage,
+                get_async_openai_client(),
+                semaphore=get_request_semaphore(),
+                on_partial=updates.put if on_partial else None,
+                **kwargs
+            ),
+            get_background_loop()
         )
-        
+        deadline = time.monotonic() + REQUEST_TIMEOUT
+        while on_partial and not future.done() and time.monotonic() < deadline:
+            try:
+                partial = updates.get(timeout=STREAM_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            while not updates.empty():
+                partial = updates.get_nowait()  # Only the latest snapshot matters
+            on_partial(partial)
+        try:
+            # Structured outputs arrive already parsed and validated
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"No response from the chef after {REQUEST_TIMEOUT} seconds")
     except Exception as e:
         st.error(f"An error occurred: {str(e)}")
-        if hasattr(result, 'raw_output'):
-            error_details = str(result.raw_output)[:200] + "..." if len(str(result.raw_output)) > 200 else str(result.raw_output)
-            st.error(f"Full response: {error_details}")
-        else:
-            st.error("No additional error details available")
         return None
 
 # Stage-specific Functions
@@ -444,20 +1012,52 @@ def handle_wine_stage():
     
     Stage Progression:
     - When user enters a wine and clicks "Get Entree Suggestions":
-        1. Saves the selected wine to session state
+        1. Saves the selected wine and batch mode to session state
         2. Fetches entree suggestions based on wine characteristics
+           (through the Batch API when batch mode is enabled; batch mode
+           also applies to the final menu analysis)
         3. Updates session state with new suggestions
-        4. Advances to ENTREE stage
+        4. Starts fetching appetizers for each entree (and desserts for
+           each of those appetizers) in the background
+        5. Advances to ENTREE stage
     """
     st.header("🍷 Wine Selection")
+    
+    enter_wine()
+
+@st.fragment
+def enter_wine():
+    """
+    Displays the wine input and fetches entrees for the chosen wine.
+    
+    Runs as a fragment, so typing a wine or flipping batch mode reruns only
+    the form instead of the whole page.
+    """
     wine_input = st.text_input("What type of wine would you like to plan your dinner around?")
+    batch_mode = st.toggle(
+        "Batch mode (cheaper, slower)",
+        help="Uses the OpenAI Batch API at half the cost for the entree suggestions and the final "
+             f"menu analysis. Results can take several minutes; after {BATCH_MAX_WAIT // 60}, the "
+             "request is sent the regular way."
+    )
     
     if wine_input and st.button("Get Entree Suggestions"):
-        with st.spinner('Getting entree suggestions...'):
+        spinner_text = 'Waiting for batch results...' if batch_mode else 'Getting entree suggestions...'
+        with st.spinner(spinner_text):
             st.session_state.wine = wine_input
-            suggestions = get_cached_suggestions(Stage.WINE, wine=wine_input)
+            st.session_state.batch_mode = batch_mode
+            suggestions = get_cached_suggestions(
+                Stage.WINE,
+                use_batch=batch_mode,
+                on_partial=stream_into(st.empty()),
+                wine=wine_input
+            )
             if suggestions:
-                st.session_state.entree_suggestions = suggestions
+                store_suggestions('entree', suggestions)
+                if not batch_mode and MENU_TREE_PREFETCH:
+                    prefetch_menu_tree(wine_input, suggestions)
+                elif not batch_mode:
+                    prefetch_next_stage(Stage.WINE, {'wine': wine_input}, suggestions)
                 st.session_state.stage = Stage.ENTREE
                 st.rerun()
 
@@ -474,30 +1074,49 @@ def handle_entree_stage():
     - When user selects an entree and clicks "Get Appetizer Suggestions":
         1. Saves the selected entree to session state
         2. Fetches appetizer suggestions based on wine and entree pairing
+           (usually already prefetched while the user was choosing)
         3. Updates session state with new suggestions
-        4. Advances to APPETIZER stage
+        4. Starts fetching desserts for each appetizer in the background
+        5. Advances to APPETIZER stage
     """
     st.header("🍖 Entree Selection")
     st.write(f"Selected Wine: {st.session_state.wine}")
     st.write("Choose your entree from these suggestions:")
     
-    for i, suggestion in enumerate(st.session_state.entree_suggestions, 1):
-        st.write(f"{i}. {suggestion['name']} - {suggestion['description']}")
+    st.write(st.session_state.entree_display)
+    
+    select_entree()
+
+@st.fragment
+def select_entree():
+    """
+    Displays the entree picker and fetches appetizers for the chosen entree.
     
-    options = {s['name']: s for s in st.session_state.entree_suggestions}
-    selected_name = st.selectbox("Select your entree:", list(options.keys()))
+    Runs as a fragment, so changing the selection reruns only the picker
+    instead of the whole page.
+    """
+    options = st.session_state.entree_options
+    selected_name = st.selectbox("Select your entree:", list(options))
     selected_item = options[selected_name] if selected_name else None
+    if selected_item:
+        prefetch_highlighted(Stage.ENTREE, {'wine': st.session_state.wine, 'entree': selected_item['name']})
     
     if selected_item and st.button("Get Appetizer Suggestions"):
         with st.spinner('Getting appetizer suggestions...'):
             st.session_state.entree = selected_item
-            suggestions = get_cached_suggestions(
+            suggestions = get_suggestions(
                 Stage.ENTREE,
+                on_partial=stream_into(st.empty()),
                 wine=st.session_state.wine,
                 entree=selected_item['name']
             )
             if suggestions:
-                st.session_state.appetizer_suggestions = suggestions
+                store_suggestions('appetizer', suggestions)
+                prefetch_next_stage(
+                    Stage.ENTREE,
+                    {'wine': st.session_state.wine, 'entree': selected_item['name']},
+                    suggestions
+                )
                 st.session_state.stage = Stage.APPETIZER
                 st.rerun()
 
@@ -514,32 +1133,66 @@ def handle_appetizer_stage():
     - When user selects an appetizer and clicks "Get Dessert Suggestions":
         1. Saves the selected appetizer to session state
         2. Fetches dessert suggestions based on wine, entree, and appetizer
+           (usually already prefetched while the user was choosing)
         3. Updates session state with new suggestions
-        4. Advances to DESSERT stage
+        4. Starts the final analysis for each dessert in the background
+        5. Advances to DESSERT stage
     """
     st.header("🥗 Appetizer Selection")
     st.write(f"Selected Wine: {st.session_state.wine}")
     st.write(f"Selected Entree: {st.session_state.entree['name']}")
     st.write("Choose your appetizer from these suggestions:")
     
-    for i, suggestion in enumerate(st.session_state.appetizer_suggestions, 1):
-        st.write(f"{i}. {suggestion['name']} - {suggestion['description']}")
+    st.write(st.session_state.appetizer_display)
+    
+    select_appetizer()
+
+@st.fragment
+def select_appetizer():
+    """
+    Displays the appetizer picker and fetches desserts for the chosen appetizer.
     
-    options = {s['name']: s for s in st.session_state.appetizer_suggestions}
-    selected_name = st.selectbox("Select your appetizer:", list(options.keys()))
+    Runs as a fragment, so changing the selection reruns only the picker
+    instead of the whole page.
+    """
+    options = st.session_state.appetizer_options
+    selected_name = st.selectbox("Select your appetizer:", list(options))
     selected_item = options[selected_name] if selected_name else None
+    if selected_item:
+        prefetch_highlighted(Stage.APPETIZER, {
+            'wine': st.session_state.wine,
+            'entree': st.session_state.entree['name'],
+            'appetizer': selected_item['name']
+        })
     
     if selected_item and st.button("Get Dessert Suggestions"):
         with st.spinner('Getting dessert suggestions...'):
             st.session_state.appetizer = selected_item
-            suggestions = get_cached_suggestions(
+            suggestions = get_suggestions(
                 Stage.APPETIZER,
+                on_partial=stream_into(st.empty()),
                 wine=st.session_state.wine,
                 entree=st.session_state.entree['name'],
                 appetizer=selected_item['name']
             )
             if suggestions:
-                st.session_state.dessert_suggestions = suggestions
+                store_suggestions('dessert', suggestions)
+                if not st.session_state.batch_mode:  # Prefetching would pay the full price
+                    prefetch_suggestions(
+                        Stage.DESSERT,
+                        [
+                            {
+                                'wine': st.session_state.wine,
+                                'entree': st.session_state.entree['name'],
+                                'entree_description': st.session_state.entree['description'],
+                                'appetizer': selected_item['name'],
+                                'appetizer_description': selected_item['description'],
+                                'dessert': s['name'],
+                                'dessert_description': s['description']
+                            }
+                            for s in suggestions
+                        ]
+                    )
                 st.session_state.stage = Stage.DESSERT
                 st.rerun()
 
@@ -556,6 +1209,8 @@ def handle_dessert_stage():
     - When user selects a dessert and clicks "See Final Analysis":
         1. Saves the selected dessert to session state
         2. Fetches final menu analysis considering all selections
+           (through the Batch API in batch mode, otherwise usually already
+           prefetched while the user was choosing)
         3. Updates session state with the analysis
         4. Advances to final stage for complete menu review
     """
@@ -565,18 +1220,39 @@ def handle_dessert_stage():
     st.write(f"Selected Appetizer: {st.session_state.appetizer['name']}")
     st.write("Choose your dessert from these suggestions:")
     
-    for i, suggestion in enumerate(st.session_state.dessert_suggestions, 1):
-        st.write(f"{i}. {suggestion['name']} - {suggestion['description']}")
+    st.write(st.session_state.dessert_display)
+    
+    select_dessert()
+
+@st.fragment
+def select_dessert():
+    """
+    Displays the dessert picker and fetches the final menu analysis for the chosen dessert.
     
-    options = {s['name']: s for s in st.session_state.dessert_suggestions}
-    selected_name = st.selectbox("Select your dessert:", list(options.keys()))
+    Runs as a fragment, so changing the selection reruns only the picker
+    instead of the whole page.
+    """
+    options = st.session_state.dessert_options
+    selected_name = st.selectbox("Select your dessert:", list(options))
     selected_item = options[selected_name] if selected_name else None
+    if selected_item and not st.session_state.batch_mode:
+        prefetch_highlighted(Stage.DESSERT, {
+            'wine': st.session_state.wine,
+            'entree': st.session_state.entree['name'],
+            'entree_description': st.session_state.entree['description'],
+            'appetizer': st.session_state.appetizer['name'],
+            'appetizer_description': st.session_state.appetizer['description'],
+            'dessert': selected_item['name'],
+            'dessert_description': selected_item['description']
+        })
     
     if selected_item and st.button("See Final Menu Analysis"):
-        with st.spinner('Analyzing menu...'):
+        batch_mode = st.session_state.batch_mode
+        with st.spinner('Waiting for batch results...' if batch_mode else 'Analyzing menu...'):
             st.session_state.dessert = selected_item
-            analysis = get_cached_suggestions(
+            analysis = get_suggestions(
                 Stage.DESSERT,
+                use_batch=batch_mode,
                 wine=st.session_state.wine,
                 entree=st.session_state.entree['name'],
                 entree_description=st.session_state.entree['description'],
@@ -636,10 +1312,17 @@ def handle_final_stage():
     st.write(analysis['overall_harmony'])
     
     if st.button("🔄 Start Over"):
-        for key in st.session_state.keys():
-            del st.session_state[key]
+        st.session_state.clear()
         st.rerun()
 
+STAGE_HANDLERS: Dict[Stage, Callable[[], None]] = {
+    Stage.WINE: handle_wine_stage,
+    Stage.ENTREE: handle_entree_stage,
+    Stage.APPETIZER: handle_appetizer_stage,
+    Stage.DESSERT: handle_dessert_stage,
+    Stage.FINAL: handle_final_stage
+}
+
 def main():
     """
     Main application entry point.
@@ -662,18 +1345,11 @@ def main():
     # Show current stage in sidebar
     st.sidebar.header("Progress")
     st.sidebar.info(f"Current Stage: {st.session_state.stage.value.title()}")
+    stats = get_cache_stats()
+    st.sidebar.caption(f"Response cache: {stats['hits']} hits, {stats['misses']} misses")
     
     # Handle current stage
-    if st.session_state.stage == Stage.WINE:
-        handle_wine_stage()
-    elif st.session_state.stage == Stage.ENTREE:
-        handle_entree_stage()
-    elif st.session_state.stage == Stage.APPETIZER:
-        handle_appetizer_stage()
-    elif st.session_state.stage == Stage.DESSERT:
-        handle_dessert_stage()
-    else:
-        handle_final_stage()
+    STAGE_HANDLERS[st.session_state.stage]()
         
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,15 +1,20 @@
-import json
-from typing import Dict, Annotated
+from typing import Annotated, Dict, List, TypedDict
 from langchain_openai import ChatOpenAI
+from openai import DefaultHttpxClient
+from langchain_core.messages import BaseMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langgraph.graph import StateGraph
+from langgraph.graph.message import add_messages
 
 from models import BookRecommendations
-from utils import state_merge, logger
-from config import MODEL_NAME, TEMPERATURE, RECOMMEND_BOOKS_SCHEMA
+from utils import logger
+from config import BOOK_MODEL_NAME, BOOK_MAX_TOKENS, TEMPERATURE, RECOMMEND_BOOKS_SCHEMA, CONNECTION_LIMITS, HTTP2
 
-# Define the state type for type hints
-State = Annotated[Dict, state_merge]
+class BookState(TypedDict):
+    """Graph state; fields a node does not return keep their current value."""
+    messages: Annotated[List[BaseMessage], add_messages]
+    input: str
+    recommendations: List[Dict]
 
 def process_book_recommendation_response(response):
     """Handle and validate the LLM response"""
@@ -17,59 +22,61 @@ def process_book_recommendation_response(response):
         logger.info("Validating LLM response structure")
         # Extract function call arguments from the response
         if hasattr(response, 'additional_kwargs') and 'function_call' in response.additional_kwargs:
-            # Parse the function call arguments
-            args = json.loads(response.additional_kwargs['function_call']['arguments'])
-            # Validate with our Pydantic model
-            recommendations = BookRecommendations(**args)
+            # Parse and validate the function call arguments with our Pydantic model in one pass
+            recommendations = BookRecommendations.model_validate_json(
+                response.additional_kwargs['function_call']['arguments']
+            )
             logger.info("Successfully validated LLM response")
-            return args
+            return recommendations.model_dump()
         else:
             logger.warning("No function call found in response")
             return {"recommendations": []}
     except Exception as e:
-        logger.error(f"Error parsing LLM response: {e}")
+        logger.error("Error parsing LLM response: %s", e)
         # Return a safe default response
         return {"recommendations": []}
 
+# Prompt template with explicit formatting instructions, built once at import
+BOOK_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are an expert librarian and book recommender. Your task is to recommend books based on the user's input.
+    Provide thoughtful recommendations that match the user's interests, whether they specify an author, genre, theme, or other criteria.
+    
+    Guidelines for recommendations:
+    1. Provide 3 high-quality recommendations
+    2. Ensure each book genuinely matches the user's interests
+    3. Include a mix of well-known and potentially overlooked books
+    4. Verify all book information is accurate
+    5. Write clear, informative descriptions of one or two sentences
+    6. Explain specifically why each book matches the request
+    
+    Your response will be automatically formatted into JSON using the function call mechanism."""),
+    MessagesPlaceholder(variable_name="messages"),
+    ("human", "{input}")
+])
+
 def create_book_agent():
     """Create an agent that recommends books based on user preferences."""
     # Initialize the LLM
     llm = ChatOpenAI(
-        model=MODEL_NAME,
+        model=BOOK_MODEL_NAME,
         temperature=TEMPERATURE,
+        max_tokens=BOOK_MAX_TOKENS,
+        http_client=DefaultHttpxClient(http2=HTTP2, limits=CONNECTION_LIMITS),
     )
 
-    # Create the prompt template with explicit formatting instructions
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are an expert librarian and book recommender. Your task is to recommend books based on the user's input.
-        Provide thoughtful recommendations that match the user's interests, whether they specify an author, genre, theme, or other criteria.
-        
-        Guidelines for recommendations:
-        1. Provide 3-5 high-quality recommendations
-        2. Ensure each book genuinely matches the user's interests
-        3. Include a mix of well-known and potentially overlooked books
-        4. Verify all book information is accurate
-        5. Write clear, informative descriptions
-        6. Explain specifically why each book matches the request
-        
-        Your response will be automatically formatted into JSON using the function call mechanism."""),
-        MessagesPlaceholder(variable_name="messages"),
-        ("human", "{input}")
-    ])
-
     # Create the chain with function calling
     chain = (
-        prompt 
+        BOOK_PROMPT
         | llm.bind(functions=[RECOMMEND_BOOKS_SCHEMA], function_call={"name": "recommend_books"}) 
         | process_book_recommendation_response
     )
 
-    def recommend_books(state: State) -> State:
+    def recommend_books(state: BookState) -> BookState:
         """Generate book recommendations based on user input."""
         logger.info("Starting book recommendation process")
         messages = state.get("messages", [])
         user_input = state.get("input", "")
-        logger.info(f"Processing request with input: {user_input}")
+        logger.info("Processing request with input: %s", user_input)
         
         # Get recommendations from the chain
         logger.info("Invoking LLM chain for recommendations")
@@ -77,16 +84,14 @@ def create_book_agent():
             "messages": messages,
             "input": user_input
         })
-        logger.info(f"Raw output from LLM: {result}")
-        logger.info(f"Received {len(result['recommendations'])} recommendations from LLM")
+        logger.debug("Raw output from LLM: %s", result)
+        logger.info("Received %d recommendations from LLM", len(result['recommendations']))
         
-        # Update the state with recommendations - result is already a dictionary
-        new_state = {"messages": messages, "input": user_input, "recommendations": result["recommendations"]}
-        logger.info("Updated state with new recommendations")
-        return new_state
+        # Return only the new recommendations; the other fields keep their values
+        return {"recommendations": result["recommendations"]}
 
     # Create the graph
-    workflow = StateGraph(State)
+    workflow = StateGraph(BookState)
 
     # Add the recommendation node
     workflow.add_node("recommend_books", recommend_books)
@@ -1,91 +1,125 @@
-import json
-from typing import Dict, Annotated
+import orjson
+from typing import Dict, TypedDict
 from langchain_openai import ChatOpenAI
+from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda, RunnableParallel
 from langgraph.graph import StateGraph
 
 from models import CrossDomainRecommendation
-from utils import state_merge, logger
-from config import MODEL_NAME, TEMPERATURE, CROSS_DOMAIN_SCHEMA
+from utils import logger
+from config import MODEL_NAME, TEMPERATURE, CROSS_DOMAIN_ITEM_SCHEMAS, CONNECTION_LIMITS, HTTP2
 
-# Define the state type for type hints
-State = Annotated[Dict, state_merge]
+class CrossDomainState(TypedDict):
+    """Graph state; fields a node does not return keep their current value."""
+    selected_book: Dict
+    cross_domain_recommendations: Dict
 
-def handle_cross_domain_response(response):
-    """Handle and validate the cross-domain recommendation response"""
+def extract_function_arguments(response):
+    """Extract the function call arguments from a single media recommendation"""
     try:
-        logger.info("Validating cross-domain response structure")
         if hasattr(response, 'additional_kwargs') and 'function_call' in response.additional_kwargs:
-            args = json.loads(response.additional_kwargs['function_call']['arguments'])
-            recommendations = CrossDomainRecommendation(**args)
-            logger.info("Successfully validated cross-domain response")
-            return args
-        else:
-            logger.warning("No function call found in cross-domain response")
-            return {}
+            return orjson.loads(response.additional_kwargs['function_call']['arguments'])
+        logger.warning("No function call found in cross-domain response")
+        return None
+    except Exception as e:
+        logger.error("Error parsing cross-domain response: %s", e)
+        return None
+
+def handle_cross_domain_response(results):
+    """Combine and validate the movie, game and song recommendations"""
+    try:
+        logger.info("Validating cross-domain response structure")
+        CrossDomainRecommendation(**results)  # Raises if any recommendation is missing or malformed
+        logger.info("Successfully validated cross-domain response")
+        return results
     except Exception as e:
-        logger.error(f"Error parsing cross-domain response: {e}")
+        logger.error("Error validating cross-domain response: %s", e)
         return {}
 
+# Prompt template shared by the movie, game and song chains, built once at import
+CROSS_DOMAIN_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are an expert content recommender who can find thematic connections across different media types.
+    Based on the given book, recommend ONE {media} that shares similar themes, moods, or ideas.
+    
+    Guidelines for recommendations:
+    1. Focus on thematic connections, not just genre matches
+    2. Consider emotional resonance and core ideas
+    3. Provide a thoughtful explanation for the recommendation
+    4. Be specific about why it connects to the book
+    5. Consider both classic and contemporary options
+    
+    Your response will be automatically formatted using the function call mechanism."""),
+    ("human", """Here is the book to base recommendations on:
+    Title: {title}
+    Author: {author}
+    Genre: {genre}
+    Description: {description}
+    
+    Please recommend related content that shares themes with this book.""")
+])
+
 def create_cross_domain_agent():
     """Create an agent that recommends related content across different domains."""
     # Initialize the LLM
     llm = ChatOpenAI(
         model=MODEL_NAME,
         temperature=TEMPERATURE,
+        http_client=DefaultHttpxClient(http2=HTTP2, limits=CONNECTION_LIMITS),
+        # Pooled async connections belong to one event loop; app.py only runs ainvoke on its background loop
+        http_async_client=DefaultAsyncHttpxClient(http2=HTTP2, limits=CONNECTION_LIMITS),
     )
 
-    # Create the prompt template
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are an expert content recommender who can find thematic connections across different media types.
-        Based on the given book, recommend ONE movie, ONE game, and ONE song that share similar themes, moods, or ideas.
-        
-        Guidelines for recommendations:
-        1. Focus on thematic connections, not just genre matches
-        2. Consider emotional resonance and core ideas
-        3. Provide thoughtful explanations for each recommendation
-        4. Be specific about why each item connects to the book
-        5. Consider both classic and contemporary options
-        
-        Your response will be automatically formatted using the function call mechanism."""),
-        ("human", """Here is the book to base recommendations on:
-        Title: {title}
-        Author: {author}
-        Genre: {genre}
-        Description: {description}
-        
-        Please recommend related content that shares themes with this book.""")
-    ])
-
-    # Create the chain
+    # Create one chain per media type and run them in parallel, so the total
+    # latency is that of the slowest recommendation rather than their sum
     chain = (
-        prompt 
-        | llm.bind(functions=[CROSS_DOMAIN_SCHEMA], function_call={"name": "recommend_cross_domain"})
+        RunnableParallel(**{
+            media: (
+                CROSS_DOMAIN_PROMPT.partial(media=media)
+                | llm.bind(functions=[schema], function_call={"name": schema["name"]})
+                | extract_function_arguments
+            )
+            for media, schema in CROSS_DOMAIN_ITEM_SCHEMAS.items()
+        })
         | handle_cross_domain_response
     )
 
-    def recommend_related_content(state: State) -> State:
+    def book_fields(selected_book):
+        """Pick out the book fields the prompt needs."""
+        return {
+            "title": selected_book.get("title"),
+            "author": selected_book.get("author"),
+            "genre": selected_book.get("genre"),
+            "description": selected_book.get("description")
+        }
+
+    def recommend_related_content(state: CrossDomainState) -> CrossDomainState:
         """Generate cross-domain recommendations based on a selected book."""
         selected_book = state.get("selected_book", {})
         if not selected_book:
             logger.warning("No book selected for cross-domain recommendations")
-            return state
+            return {}
 
-        logger.info(f"Generating cross-domain recommendations for book: {selected_book.get('title')}")
-        result = chain.invoke({
-            "title": selected_book.get("title"),
-            "author": selected_book.get("author"),
-            "genre": selected_book.get("genre"),
-            "description": selected_book.get("description")
-        })
-        logger.info(f"Cross domain raw output from LLM: {result}")
-        
-        state["cross_domain_recommendations"] = result
-        return state
+        logger.info("Generating cross-domain recommendations for book: %s", selected_book.get('title'))
+        result = chain.invoke(book_fields(selected_book))
+        logger.debug("Cross domain raw output from LLM: %s", result)
+        return {"cross_domain_recommendations": result}
+
+    async def arecommend_related_content(state: CrossDomainState) -> CrossDomainState:
+        """Async version of recommend_related_content, used by graph.ainvoke so concurrent books share one event loop."""
+        selected_book = state.get("selected_book", {})
+        if not selected_book:
+            logger.warning("No book selected for cross-domain recommendations")
+            return {}
+
+        logger.info("Generating cross-domain recommendations for book: %s", selected_book.get('title'))
+        result = await chain.ainvoke(book_fields(selected_book))
+        logger.debug("Cross domain raw output from LLM: %s", result)
+        return {"cross_domain_recommendations": result}
 
     # Create the graph
-    workflow = StateGraph(State)
-    workflow.add_node("recommend_related", recommend_related_content)
+    workflow = StateGraph(CrossDomainState)
+    workflow.add_node("recommend_related", RunnableLambda(recommend_related_content, afunc=arecommend_related_content))
     workflow.set_entry_point("recommend_related")
     workflow.set_finish_point("recommend_related")
     
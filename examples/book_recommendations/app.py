@@ -1,9 +1,96 @@
+import asyncio
+import re
+import threading
+import time
 import streamlit as st
-from models import BookRecommendation
-from agents.book_agent import create_book_agent
-from agents.cross_domain_agent import create_cross_domain_agent
+from pydantic_core import from_json
 from utils import logger
 from auth import requires_auth
+from config import RECOMMENDATION_CACHE_SIZE, STREAM_RENDER_INTERVAL
+
+@st.cache_resource(show_spinner=False)
+def get_book_agent():
+    """Build the book recommendation graph once per process, not on every click."""
+    # The agents pull in langchain_openai and langgraph; importing them here keeps the first page draw fast
+    from agents.book_agent import create_book_agent
+    return create_book_agent()
+
+@st.cache_resource(show_spinner=False)
+def get_cross_domain_agent():
+    """Build the cross-domain recommendation graph once per process, not on every click."""
+    from agents.cross_domain_agent import create_cross_domain_agent
+    return create_cross_domain_agent()
+
+@st.cache_resource(show_spinner=False)
+def warm_up_agents():
+    """Build both graphs in the background, once per process, while the user logs in or types."""
+    thread = threading.Thread(target=lambda: (get_book_agent(), get_cross_domain_agent()), daemon=True)
+    thread.start()
+    return thread
+
+@st.cache_resource(show_spinner=False)
+def get_background_loop():
+    """Start the event loop that runs every async graph call, once per process.
+
+    The cached graphs keep their async connection pools between reruns, and those
+    connections only work on the loop that opened them, so every call goes to this loop.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="graph-requests", daemon=True).start()
+    return loop
+
+@st.cache_resource(show_spinner=False)
+def get_recommendation_cache():
+    """Books already recommended per request, shared by every session in this process."""
+    return {}
+
+def cache_recommendations(cache_key, recommendations):
+    """Remember a request's recommendations, dropping the oldest request once the cache is full."""
+    cache = get_recommendation_cache()
+    cache[cache_key] = recommendations
+    if len(cache) > RECOMMENDATION_CACHE_SIZE:
+        cache.pop(next(iter(cache)))
+
+def normalize_request(text):
+    """Reduce a request to its lowercase words, so "Sci-fi " and "sci fi" share a cache entry."""
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+def book_key(book):
+    """Identify a recommended book by its title and author."""
+    return (book["title"], book["author"])
+
+async def gather_related_content(graph, books):
+    """Run the cross-domain graph for every book at once; failures are returned, not raised."""
+    return await asyncio.gather(
+        *(graph.ainvoke({"selected_book": book}) for book in books),
+        return_exceptions=True
+    )
+
+def fetch_related_content(graph, books):
+    """Fetch related content for every book on the background loop and wait for the results."""
+    return asyncio.run_coroutine_threadsafe(gather_related_content(graph, books), get_background_loop()).result()
+
+def store_recommendations(recommendations):
+    """Keep a new set of recommendations, with their titles, and forget what was derived from the last set."""
+    st.session_state.book_recommendations = recommendations
+    st.session_state.book_titles = tuple(book["title"] for book in recommendations)
+    st.session_state.cross_domain_by_title = {}
+    st.session_state.pop("selected_book_idx", None)
+
+def render_partial_recommendations(placeholder, arguments):
+    """Show the books named so far in the streamed function call arguments."""
+    try:
+        partial = from_json(arguments, allow_partial=True)
+    except ValueError:
+        return  # Not enough of the arguments has arrived yet
+    books = partial.get("recommendations", []) if isinstance(partial, dict) else []
+    lines = [
+        f"{i}. **{book.get('title', '')}**" + (f" by {book['author']}" if book.get("author") else "")
+        for i, book in enumerate(books, 1)
+        if isinstance(book, dict) and book.get("title")
+    ]
+    if lines:
+        placeholder.markdown("\n".join(lines))
 
 @requires_auth
 def main():
@@ -27,29 +114,63 @@ def main():
     # Store the book recommendations in session state
     if "book_recommendations" not in st.session_state:
         st.session_state.book_recommendations = None
+    if "cross_domain_by_title" not in st.session_state:
+        st.session_state.cross_domain_by_title = {}
 
     if st.button("Get Recommendations"):
         if user_input:
             logger.info("User submitted request for recommendations")
-            # Create and run the graph
-            logger.info("Creating recommendation agent")
-            graph = create_book_agent()
-            
-            # Initialize the state
-            state = {
-                "messages": [],
-                "input": user_input,
-                "recommendations": []
-            }
-            logger.info(f"Initialized state with input: {user_input}")
-
-            # Run the graph
-            with st.spinner("Generating recommendations..."):
-                logger.info("Running recommendation graph")
-                result = graph.invoke(state)
-                logger.info("Received recommendations from graph")
-                # Store recommendations in session state
-                st.session_state.book_recommendations = result["recommendations"]
+            cache = get_recommendation_cache()
+            cache_key = normalize_request(user_input)
+            if cache_key in cache:
+                logger.info("Recommendation cache hit for %r, skipped the LLM call", cache_key)
+                store_recommendations(cache[cache_key])
+            else:
+                # Create and run the graph
+                logger.info("Creating recommendation agent")
+                graph = get_book_agent()
+                
+                # Initialize the state
+                state = {
+                    "messages": [],
+                    "input": user_input,
+                    "recommendations": []
+                }
+                logger.info("Initialized state with input: %s", user_input)
+
+                # Run the graph, showing each book as soon as the LLM names it
+                result = None
+                with st.spinner("Generating recommendations..."):
+                    logger.info("Running recommendation graph")
+                    placeholder = st.empty()
+                    arguments = ""
+                    last_render = 0.0
+                    try:
+                        for mode, payload in graph.stream(state, stream_mode=["messages", "values"]):
+                            if mode == "values":
+                                result = payload
+                                continue
+                            chunk, _ = payload
+                            arguments += chunk.additional_kwargs.get("function_call", {}).get("arguments", "")
+                            # Redraw on a timer rather than for every token
+                            if time.monotonic() - last_render >= STREAM_RENDER_INTERVAL:
+                                render_partial_recommendations(placeholder, arguments)
+                                last_render = time.monotonic()
+                    except Exception as e:
+                        logger.error("Error running recommendation graph: %s", e, exc_info=True)
+                        result = None
+                    placeholder.empty()
+
+                if result is None:
+                    st.error("Failed to generate recommendations. Please try again.")
+                else:
+                    logger.info("Received recommendations from graph")
+                    # Store recommendations in session state
+                    store_recommendations(result["recommendations"])
+
+                    # Remember successful answers only, so a failed request is tried again
+                    if result["recommendations"]:
+                        cache_recommendations(cache_key, result["recommendations"])
 
         else:
             logger.warning("User attempted to submit without input")
@@ -57,66 +178,88 @@ def main():
 
     # Display book recommendations if available
     if st.session_state.book_recommendations:
-        logger.info(f"Processing {len(st.session_state.book_recommendations)} recommendations for display")
-        for i, book_dict in enumerate(st.session_state.book_recommendations, 1):
-            logger.debug(f"Processing recommendation {i}: {book_dict['title']}")
-            book = BookRecommendation(**book_dict)
-            with st.container():
-                st.subheader(f"{i}. {book.title} by {book.author}")
-                st.write(f"**Genre:** {book.genre}")
-                st.write(f"**Description:** {book.description}")
-                st.write(f"**Why this book:** {book.reason}")
-                st.divider()
-        logger.info("Finished displaying recommendations")
+        logger.debug("Processing %d recommendations for display", len(st.session_state.book_recommendations))
+        # The recommendations were validated when the LLM response was parsed
+        for i, book in enumerate(st.session_state.book_recommendations, 1):
+            logger.debug("Processing recommendation %d: %s", i, book['title'])
+            # One markdown element per book keeps the number of elements sent on each rerun low
+            st.markdown(
+                f"### {i}. {book['title']} by {book['author']}\n"
+                f"**Genre:** {book['genre']}\n\n"
+                f"**Description:** {book['description']}\n\n"
+                f"**Why this book:** {book['reason']}\n\n"
+                "---"
+            )
+        logger.debug("Finished displaying recommendations")
+
+        # Fetch related content for every book at once, so picking a book is instant
+        cross_domain_graph = get_cross_domain_agent()
+        related = st.session_state.cross_domain_by_title
+        pending = [book for book in st.session_state.book_recommendations if book_key(book) not in related]
+        if pending:
+            with st.spinner("Finding related content..."):
+                logger.info("Prefetching cross-domain recommendations for %d books", len(pending))
+                results = fetch_related_content(cross_domain_graph, pending)
+            for book, result in zip(pending, results):
+                if isinstance(result, Exception):
+                    logger.warning("Cross-domain prefetch failed for %s: %s", book["title"], result)
+                    result = {}
+                # None marks a failed prefetch, so it is retried from the button rather than on every rerun
+                related[book_key(book)] = result.get("cross_domain_recommendations") or None
 
         # Add a section for cross-domain recommendations
         st.subheader("Get Cross-Domain Recommendations")
-        st.write("Select a book to get related movie, game, and song recommendations that share similar themes.")
+        st.write("Select a book to see related movie, game, and song recommendations that share similar themes.")
         
-        # Create dropdown with book titles
-        book_titles = [book["title"] for book in st.session_state.book_recommendations]
+        # Create dropdown with the book titles saved alongside the recommendations
+        book_titles = st.session_state.book_titles
         selected_index = st.selectbox(
             "Select a book",
             range(len(book_titles)),
-            format_func=lambda i: book_titles[i]
+            format_func=book_titles.__getitem__,
+            key="selected_book_idx"
         )
+        selected_book = st.session_state.book_recommendations[selected_index]
+        recommendations = related.get(book_key(selected_book))
 
-        if st.button("Get Related Content"):
-            # Create cross-domain agent
-            cross_domain_graph = create_cross_domain_agent()
-            selected_book = st.session_state.book_recommendations[selected_index]
-            
-            # Initialize state with selected book
-            state = {"selected_book": selected_book}
-            
-            # Get cross-domain recommendations
+        # Only books whose prefetch failed need a button to try again
+        if recommendations is None and st.button("Get Related Content"):
             with st.spinner("Finding related content..."):
-                result = cross_domain_graph.invoke(state)
+                result = cross_domain_graph.invoke({"selected_book": selected_book})
                 recommendations = result.get("cross_domain_recommendations", {})
+                related[book_key(selected_book)] = recommendations or None
+
+        if recommendations is not None:
+            if recommendations:
+                # Display movie recommendation
+                movie = recommendations.get("movie", {})
+                st.markdown(
+                    "### 🎬 Movie Recommendation\n"
+                    f"**{movie.get('title')} ({movie.get('year')})**\n\n"
+                    f"{movie.get('description')}\n\n"
+                    f"**Why this movie:** {movie.get('reason')}"
+                )
                 
-                if recommendations:
-                    # Display movie recommendation
-                    st.subheader("🎬 Movie Recommendation")
-                    movie = recommendations.get("movie", {})
-                    st.write(f"**{movie.get('title')} ({movie.get('year')})**")
-                    st.write(movie.get('description'))
-                    st.write(f"**Why this movie:** {movie.get('reason')}")
-                    
-                    # Display game recommendation
-                    st.subheader("🎮 Game Recommendation")
-                    game = recommendations.get("game", {})
-                    st.write(f"**{game.get('title')} ({game.get('platform')})**")
-                    st.write(game.get('description'))
-                    st.write(f"**Why this game:** {game.get('reason')}")
-                    
-                    # Display song recommendation
-                    st.subheader("🎵 Song Recommendation")
-                    song = recommendations.get("song", {})
-                    st.write(f"**{song.get('title')} by {song.get('artist')}**")
-                    st.write(song.get('description'))
-                    st.write(f"**Why this song:** {song.get('reason')}")
-                else:
-                    st.error("Failed to generate cross-domain recommendations. Please try again.")
+                # Display game recommendation
+                game = recommendations.get("game", {})
+                st.markdown(
+                    "### 🎮 Game Recommendation\n"
+                    f"**{game.get('title')} ({game.get('platform')})**\n\n"
+                    f"{game.get('description')}\n\n"
+                    f"**Why this game:** {game.get('reason')}"
+                )
+                
+                # Display song recommendation
+                song = recommendations.get("song", {})
+                st.markdown(
+                    "### 🎵 Song Recommendation\n"
+                    f"**{song.get('title')} by {song.get('artist')}**\n\n"
+                    f"{song.get('description')}\n\n"
+                    f"**Why this song:** {song.get('reason')}"
+                )
+            else:
+                st.error("Failed to generate cross-domain recommendations. Please try again.")
 
 if __name__ == "__main__":
+    warm_up_agents()
     main()
@@ -1,3 +1,6 @@
+import importlib.util
+
+import httpx
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -5,7 +8,14 @@ load_dotenv()
 
 # OpenAI model configuration
 MODEL_NAME = "gpt-4-turbo-preview"
+BOOK_MODEL_NAME = "gpt-4o-mini"  # Listing books that match a request needs no larger model
 TEMPERATURE = 0.7
+BOOK_MAX_TOKENS = 800  # Caps the reply; three short recommendations fit well within it
+STREAM_RENDER_INTERVAL = 0.05  # Seconds between redraws of streamed recommendations
+# Keep connections to the OpenAI API open between calls, multiplexed over HTTP/2 when h2 is installed
+CONNECTION_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=120)
+HTTP2 = importlib.util.find_spec("h2") is not None
+RECOMMENDATION_CACHE_SIZE = 256  # Distinct requests whose recommendations are kept in memory
 
 # Function schemas
 RECOMMEND_BOOKS_SCHEMA = {
@@ -19,11 +29,11 @@ RECOMMEND_BOOKS_SCHEMA = {
                 "items": {
                     "type": "object",
                     "properties": {
-                        "title": {"type": "string", "description": "The title of the book"},
-                        "author": {"type": "string", "description": "The author of the book"},
-                        "genre": {"type": "string", "description": "The genre of the book"},
-                        "description": {"type": "string", "description": "A brief description of the book"},
-                        "reason": {"type": "string", "description": "Why this book matches the user's request"}
+                        "title": {"type": "string"},
+                        "author": {"type": "string"},
+                        "genre": {"type": "string"},
+                        "description": {"type": "string", "description": "One or two sentences"},
+                        "reason": {"type": "string", "description": "One sentence on why it matches the request"}
                     },
                     "required": ["title", "author", "genre", "description", "reason"]
                 }
@@ -42,30 +52,30 @@ CROSS_DOMAIN_SCHEMA = {
             "movie": {
                 "type": "object",
                 "properties": {
-                    "title": {"type": "string", "description": "The title of the movie"},
-                    "year": {"type": "string", "description": "Release year of the movie"},
-                    "description": {"type": "string", "description": "Brief description of the movie"},
-                    "reason": {"type": "string", "description": "Why this movie matches the book's themes"}
+                    "title": {"type": "string"},
+                    "year": {"type": "string"},
+                    "description": {"type": "string", "description": "One or two sentences"},
+                    "reason": {"type": "string", "description": "One sentence on the shared themes"}
                 },
                 "required": ["title", "year", "description", "reason"]
             },
             "game": {
                 "type": "object",
                 "properties": {
-                    "title": {"type": "string", "description": "The title of the game"},
+                    "title": {"type": "string"},
                     "platform": {"type": "string", "description": "Gaming platform(s)"},
-                    "description": {"type": "string", "description": "Brief description of the game"},
-                    "reason": {"type": "string", "description": "Why this game matches the book's themes"}
+                    "description": {"type": "string", "description": "One or two sentences"},
+                    "reason": {"type": "string", "description": "One sentence on the shared themes"}
                 },
                 "required": ["title", "platform", "description", "reason"]
             },
             "song": {
                 "type": "object",
                 "properties": {
-                    "title": {"type": "string", "description": "The title of the song"},
-                    "artist": {"type": "string", "description": "The artist/band name"},
-                    "description": {"type": "string", "description": "Brief description of the song"},
-                    "reason": {"type": "string", "description": "Why this song matches the book's themes"}
+                    "title": {"type": "string"},
+                    "artist": {"type": "string", "description": "Artist or band"},
+                    "description": {"type": "string", "description": "One or two sentences"},
+                    "reason": {"type": "string", "description": "One sentence on the shared themes"}
                 },
                 "required": ["title", "artist", "description", "reason"]
             }
@@ -73,3 +83,13 @@ CROSS_DOMAIN_SCHEMA = {
         "required": ["movie", "game", "song"]
     }
 }
+
+# One function per media type, so the three recommendations can be requested in parallel
+CROSS_DOMAIN_ITEM_SCHEMAS = {
+    media: {
+        "name": f"recommend_{media}",
+        "description": f"Generate a recommendation for a {media} that matches a book's themes",
+        "parameters": item_schema
+    }
+    for media, item_schema in CROSS_DOMAIN_SCHEMA["parameters"]["properties"].items()
+}
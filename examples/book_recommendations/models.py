@@ -15,21 +15,6 @@ class BookRecommendations(BaseModel):
 
 class CrossDomainRecommendation(BaseModel):
     """Schema for cross-domain recommendations based on a book."""
-    movie: dict = Field(description="A movie recommendation", example={
-        "title": "Movie Title",
-        "year": "Release Year",
-        "description": "Brief description",
-        "reason": "Why it matches the book's themes"
-    })
-    game: dict = Field(description="A game recommendation", example={
-        "title": "Game Title",
-        "platform": "Gaming Platform",
-        "description": "Brief description",
-        "reason": "Why it matches the book's themes"
-    })
-    song: dict = Field(description="A song recommendation", example={
-        "title": "Song Title",
-        "artist": "Artist Name",
-        "description": "Brief description",
-        "reason": "Why it matches the book's themes"
-    })
+    movie: dict = Field(description="A movie recommendation")
+    game: dict = Field(description="A game recommendation")
+    song: dict = Field(description="A song recommendation")
@@ -1,5 +1,4 @@
 import logging
-from typing import Dict
 
 # Configure logging
 logging.basicConfig(
@@ -9,7 +8,7 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def state_merge(state1: Dict, state2: Dict) -> Dict:
-    """Merge two states together."""
-    state1.update(state2)
-    return state1
+# The format above never shows process or thread details, so skip collecting them per record
+logging.logProcesses = False
+logging.logThreads = False
+logging.logMultiprocessing = False
@@ -0,0 +1,569 @@
+"""
+Shared pieces of the Dinner Party Planner.
+
+The stages, the crew's agents and tasks, the Batch API calls and the wine
+name matching live here rather than in app.py, so scripts/warm_cache.py and
+the tests can use them without running the Streamlit page. Streamlit runs app.py again on every interaction but
+imports this module once per process, so the agents and the client below are
+built only once.
+"""
+
+import os
+# Suppress CrewAI's OpenTelemetry warning
+os.environ["OTEL_PYTHON_DISABLED"] = "true"
+
+from crewai import Agent, Task
+from openai import OpenAI, DefaultHttpxClient
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+import functools
+import httpx
+import importlib.util
+import logging
+import orjson
+import re
+import time
+import unicodedata
+from enum import Enum
+from typing import List, Dict, Optional, Any, Union, Type
+
+logger = logging.getLogger(__name__)
+
+class Stage(str, Enum):
+    """
+    Tracks the current stage of dinner party planning.
+    
+    The stages must be completed in sequence:
+    WINE -> ENTREE -> APPETIZER -> DESSERT
+    
+    Each stage builds upon the selections made in previous stages to ensure
+    a cohesive dining experience.
+    """
+    WINE = 'wine'
+    ENTREE = 'entree'
+    APPETIZER = 'appetizer'
+    DESSERT = 'dessert'
+    FINAL = 'final'
+
+# Response Models
+class Suggestion(BaseModel):
+    """A single course suggestion from the Chef."""
+    model_config = ConfigDict(extra="forbid")  # Strict structured outputs disallow extra keys
+    name: str = Field(..., description="Name of the dish")
+    description: str = Field(..., description="Why the dish suits the menu")
+
+class SuggestionList(BaseModel):
+    """The Chef's suggestions for a course."""
+    model_config = ConfigDict(extra="forbid")
+    suggestions: List[Suggestion] = Field(..., description="Exactly three suggestions")
+
+class CoursePlan(BaseModel):
+    """Appetizers and desserts to go with one entree."""
+    model_config = ConfigDict(extra="forbid")
+    entree: str = Field(..., description="Name of the entree")
+    appetizers: List[Suggestion] = Field(..., description="Exactly three appetizers leading into the entree")
+    desserts: List[Suggestion] = Field(..., description="Exactly three desserts following the entree")
+
+class MenuTree(BaseModel):
+    """Course plans for every entree on offer."""
+    model_config = ConfigDict(extra="forbid")
+    courses: List[CoursePlan] = Field(..., description="One plan per entree, in the order given")
+
+class MenuAnalysis(BaseModel):
+    """The Sommelier's analysis of the complete menu."""
+    model_config = ConfigDict(extra="forbid")
+    wine_pairing: str = Field(..., description="How the wine pairs with each course")
+    flavor_progression: str = Field(..., description="How flavors progress through the meal")
+    highlights: str = Field(..., description="Notable flavor combinations and standout elements")
+    overall_harmony: str = Field(..., description="How well the entire menu works together")
+
+# Structured output returned by the final task of each stage
+STAGE_RESPONSE_MODELS: Dict[Stage, Type[BaseModel]] = {
+    Stage.WINE: SuggestionList,
+    Stage.ENTREE: SuggestionList,
+    Stage.APPETIZER: SuggestionList,
+    Stage.DESSERT: MenuAnalysis,
+}
+
+# OpenAI Configuration
+MODEL = "gpt-4o-mini"  # Faster and cheaper than gpt-3.5-turbo
+STAGE_MODELS: Dict[Stage, str] = {
+    Stage.DESSERT: "gpt-4o",  # The one-off final analysis is worth the larger model
+}
+TEMPERATURE = 0.7  # Lower temperature for more focused responses
+MAX_TOKENS = 400  # Caps each response; three suggestions fit well within it
+# The menu analysis covers the whole menu and runs past the default cap
+STAGE_MAX_TOKENS: Dict[Stage, int] = {
+    Stage.DESSERT: 1200,
+}
+PROMPT_CACHE_KEY = "dinner-planner-v1"  # Routes requests sharing a prompt prefix to the same cache
+
+# HTTP Connection Configuration
+# httpx closes idle connections after 5 seconds by default, so every click after
+# the user has read the suggestions paid for a new TLS handshake
+CONNECTION_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=120)
+HTTP2 = importlib.util.find_spec("h2") is not None  # httpx needs the optional h2 package for HTTP/2
+
+# Batch API Configuration
+BATCH_POLL_INTERVAL = 5  # Seconds before the first batch status check
+BATCH_MAX_POLL_INTERVAL = 60  # Upper bound for the polling backoff
+BATCH_MAX_WAIT = 600  # Seconds the page waits on a batch before cancelling it and asking in real time
+BATCH_FAILED_STATUSES = {"failed", "expired", "cancelled"}
+
+# Entree suggestions precomputed by scripts/warm_cache.py
+WARM_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_warm.json")
+
+@functools.lru_cache(maxsize=None)  # Keeps the connection pool (and its TLS sessions) alive across reruns
+def get_openai_client() -> OpenAI:
+    """
+    Creates the synchronous OpenAI client used for Batch API and embedding calls.
+    
+    The API key is read from OPENAI_API_KEY.
+    
+    Returns:
+        OpenAI: Shared client
+    """
+    return OpenAI(
+        http_client=DefaultHttpxClient(http2=HTTP2, limits=CONNECTION_LIMITS)
+    )
+
+# Agent Definitions
+@functools.lru_cache(maxsize=None)
+def create_sommelier_agent() -> Agent:
+    """
+    Creates a Sommelier AI agent specialized in wine expertise.
+    
+    The Sommelier agent provides:
+    - Wine characteristics and flavor profiles
+    - Food pairing suggestions
+    - Professional wine knowledge and recommendations
+    
+    The agent is built once and shared by every task that needs it.
+    
+    Returns:
+        Agent: Configured Sommelier agent with wine expertise
+    """
+    return Agent(
+        role='Expert Sommelier and Food Pairing Specialist',
+        goal='Help create perfect food and wine pairings',
+        backstory="""You are a renowned sommelier with decades of experience in wine
+        and food pairing. You have an encyclopedic knowledge of wines and their characteristics.""",
+        allow_delegation=True,  # Enable collaboration with Chef
+        verbose=False,  # Requests are sent directly, not through CrewAI's executor
+        llm_model=MODEL,
+        temperature=TEMPERATURE
+    )
+
+@functools.lru_cache(maxsize=None)
+def create_chef_agent() -> Agent:
+    """
+    Creates a Chef AI agent specialized in culinary expertise.
+    
+    The Chef agent provides:
+    - Menu suggestions based on wine selection
+    - Flavor combinations and progression
+    - Professional culinary knowledge and techniques
+    
+    The agent is built once and shared by every task that needs it.
+    
+    Returns:
+        Agent: Configured Chef agent with culinary expertise
+    """
+    return Agent(
+        role='Expert Chef',
+        goal='Create delicious and harmonious menu combinations',
+        backstory="""You are an experienced chef with deep knowledge of flavors,
+        cooking techniques, and food pairings. You excel at creating cohesive menus.""",
+        allow_delegation=True,  # Enable collaboration with Sommelier
+        verbose=False,  # Requests are sent directly, not through CrewAI's executor
+        llm_model=MODEL,
+        temperature=TEMPERATURE
+    )
+
+# Task Templates
+# Each stage is a single task. The suggestion stages go straight to the chef: a
+# separate sommelier analysis would only ever be read by the chef, so the chef
+# prompt names what to consider instead of waiting on another round-trip.
+# Descriptions are str.format templates filled with the stage-specific
+# parameters, so the static prompt text is only built once. The output format
+# is enforced by STAGE_RESPONSE_MODELS, so the prompts do not spell it out.
+
+# Placeholders sit at the end of each description so every request for a task
+# shares the same prompt prefix, which the API caches and bills at a discount
+STAGE_TASK_TEMPLATES: Dict[Stage, Dict[str, str]] = {
+    Stage.WINE: {
+        "agent": "chef",
+        "description": "Considering the body, tannins, acidity and primary flavors of the wine below, suggest three dinner entrees that pair well with it.\n\nWine: {wine}",
+        "expected_output": "Three entree suggestions."
+    },
+    Stage.ENTREE: {
+        "agent": "chef",
+        "description": "Considering the progression of flavors through the meal, suggest three appetizers that complement both the wine and the entree below and lead harmoniously into the entree.\n\nWine: {wine}\nEntree: {entree}",
+        "expected_output": "Three appetizer suggestions."
+    },
+    Stage.APPETIZER: {
+        "agent": "chef",
+        "description": "Considering the progression of flavors through the meal, suggest three desserts that complement the wine and follow harmoniously from the appetizer and entree below.\n\nWine: {wine}\nAppetizer: {appetizer}\nEntree: {entree}",
+        "expected_output": "Three dessert suggestions."
+    },
+    Stage.DESSERT: {
+        "agent": "sommelier",
+        "description": """Analyze how the following menu components will interact together:
+                Wine: {wine}
+                Appetizer: {appetizer} ({appetizer_description})
+                Entree: {entree} ({entree_description})
+                Dessert: {dessert} ({dessert_description})""",
+        "expected_output": "An analysis of the wine pairing, flavor progression, highlights and overall harmony of the menu."
+    }
+}
+
+def create_crew_task(stage: Stage, **kwargs) -> Optional[Task]:
+    """
+    Creates the task for the AI crew based on the current planning stage.
+    
+    Each stage requires different expertise and considerations:
+    - WINE: Entrees drawing on the wine's profile
+    - ENTREE: Main course suggestions based on wine
+    - APPETIZER: Starter suggestions complementing wine and entree
+    - DESSERT: Dessert suggestions and final menu analysis
+    
+    Args:
+        stage: Current stage of dinner planning
+        **kwargs: Stage-specific parameters
+            - wine: str - Selected wine (required for all stages)
+            - entree: str - Selected entree (required for appetizer/dessert)
+            - appetizer: str - Selected appetizer (required for dessert)
+    
+    Returns:
+        Optional[Task]: Task for the AI crew to execute, or None if the stage has none
+    """
+    template = STAGE_TASK_TEMPLATES.get(stage)
+    if template is None:
+        return None
+    return Task(
+        description=template["description"].format_map(kwargs),
+        agent=create_stage_agent(template),
+        expected_output=template["expected_output"]
+    )
+
+def create_stage_agent(template: Dict[str, str]) -> Agent:
+    """
+    Returns the agent named by a stage's task template.
+    
+    Args:
+        template: Entry of STAGE_TASK_TEMPLATES
+    
+    Returns:
+        Agent: The shared Sommelier or Chef agent
+    """
+    return create_sommelier_agent() if template["agent"] == "sommelier" else create_chef_agent()
+
+def build_task_messages(task: Task) -> List[Dict[str, str]]:
+    """
+    Builds the chat messages for a single crew task.
+    
+    The agent's role, goal and backstory become the system prompt, mirroring
+    how CrewAI frames the task for the agent. The expected output comes before
+    the description so that only the tail of the prompt varies between requests.
+    
+    Args:
+        task: The task to run
+    
+    Returns:
+        List[Dict[str, str]]: Messages for the chat completions API
+    """
+    agent = task.agent
+    prompt = f"Expected output: {task.expected_output}\n\n{task.description}"
+    return [
+        {
+            "role": "system",
+            "content": f"Role: {agent.role}\nGoal: {agent.goal}\nBackground: {agent.backstory}"
+        },
+        {"role": "user", "content": prompt}
+    ]
+
+def completion_params(
+    model: str = MODEL,
+    max_tokens: int = MAX_TOKENS,
+    service_tier: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Returns the chat completion parameters shared by every request.
+    
+    Args:
+        model: Model to use (see STAGE_MODELS)
+        max_tokens: Cap on the response length
+        service_tier: Processing tier (see STAGE_SERVICE_TIERS); the account default if None
+    
+    Returns:
+        Dict[str, Any]: Model, sampling, length and caching settings for the request
+    """
+    params = {
+        "model": model,
+        "temperature": TEMPERATURE,
+        "max_tokens": max_tokens,
+        # Sent as an extra body field, since the pinned SDK has no keyword for it
+        "extra_body": {"prompt_cache_key": PROMPT_CACHE_KEY}
+    }
+    if service_tier is not None:
+        params["service_tier"] = service_tier
+    return params
+
+def batch_completion_params(model: str = MODEL, max_tokens: int = MAX_TOKENS) -> Dict[str, Any]:
+    """
+    Returns completion_params in the form of a Batch API request body.
+    
+    The body is sent as plain JSON, so fields the SDK takes through
+    `extra_body` go at its top level.
+    
+    Args:
+        model: Model to use (see STAGE_MODELS)
+        max_tokens: Cap on the response length (see STAGE_MAX_TOKENS)
+    
+    Returns:
+        Dict[str, Any]: Request body fields shared by every batched request
+    """
+    params = completion_params(model=model, max_tokens=max_tokens)
+    extra_body = params.pop("extra_body", {})
+    return {**params, **extra_body}
+
+def response_format_param(response_model: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    Builds the strict structured output format for a response model.
+    
+    Used for Batch API requests, which take the raw request body rather than
+    a Pydantic model.
+    
+    Args:
+        response_model: Pydantic model describing the expected output
+    
+    Returns:
+        Dict[str, Any]: Value for the request's `response_format`
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": response_model.__name__,
+            "schema": response_model.model_json_schema(),
+            "strict": True
+        }
+    }
+
+def unwrap_structured_output(result: BaseModel) -> Union[List[Dict], Dict]:
+    """
+    Converts a parsed stage result into the plain data stored in session state.
+    
+    Args:
+        result: SuggestionList or MenuAnalysis
+    
+    Returns:
+        Union[List[Dict], Dict]: Suggestions, or the menu analysis for the DESSERT stage
+    """
+    if isinstance(result, SuggestionList):
+        return [suggestion.model_dump() for suggestion in result.suggestions]
+    return result.model_dump()
+
+def submit_batch(requests: List[Dict]) -> str:
+    """
+    Submits chat completion requests to the OpenAI Batch API.
+    
+    Batch jobs are billed at half the price of real-time requests in exchange
+    for asynchronous processing.
+    
+    Args:
+        requests: Dictionaries with a unique 'custom_id' and the request 'body'
+    
+    Returns:
+        str: ID of the created batch
+    """
+    lines = [
+        orjson.dumps({
+            "custom_id": request["custom_id"],
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": request["body"]
+        })
+        for request in requests
+    ]
+    batch_file = get_openai_client().files.create(
+        file=("batch.jsonl", b"\n".join(lines)),
+        purpose="batch"
+    )
+    batch = get_openai_client().batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    return batch.id
+
+def wait_for_batch(batch_id: str, max_wait: Optional[float] = BATCH_MAX_WAIT) -> Dict[str, Optional[str]]:
+    """
+    Polls a batch with exponential backoff until it completes.
+    
+    Args:
+        batch_id: ID returned by submit_batch
+        max_wait: Seconds to wait before cancelling the batch, or None to wait
+            for its whole completion window
+    
+    Returns:
+        Dict[str, Optional[str]]: Response content keyed by each request's custom_id
+            (None for requests cut off by their token cap, which are logged)
+    
+    Raises:
+        RuntimeError: If the batch or any of its requests failed
+        TimeoutError: If the batch was cancelled after max_wait seconds
+    """
+    deadline = None if max_wait is None else time.monotonic() + max_wait
+    delay = BATCH_POLL_INTERVAL
+    batch = get_openai_client().batches.retrieve(batch_id)
+    while batch.status != "completed":
+        if batch.status in BATCH_FAILED_STATUSES:
+            raise RuntimeError(f"Batch {batch_id} ended with status '{batch.status}'")
+        if deadline is not None and time.monotonic() >= deadline:
+            get_openai_client().batches.cancel(batch_id)
+            logger.warning("Cancelled batch %s after %s seconds", batch_id, max_wait)
+            raise TimeoutError(f"Batch {batch_id} did not finish within {max_wait} seconds")
+        time.sleep(delay if deadline is None else min(delay, max(deadline - time.monotonic(), 0)))
+        delay = min(delay * 2, BATCH_MAX_POLL_INTERVAL)
+        batch = get_openai_client().batches.retrieve(batch_id)
+    
+    if not batch.output_file_id:
+        raise RuntimeError(f"Batch {batch_id} completed without any successful requests")
+    
+    results = {}
+    for line in get_openai_client().files.content(batch.output_file_id).content.splitlines():
+        record = orjson.loads(line)
+        choice = record["response"]["body"]["choices"][0]
+        if choice["finish_reason"] == "length":
+            logger.error("Batch %s request %s was cut off by its token cap", batch_id, record["custom_id"])
+            results[record["custom_id"]] = None
+            continue
+        results[record["custom_id"]] = choice["message"]["content"] or ""
+    return results
+
+def run_stages_batch(
+    runs: List[tuple[Stage, Dict[str, Any]]],
+    max_wait: Optional[float] = BATCH_MAX_WAIT
+) -> List[Optional[Union[List[Dict], Dict]]]:
+    """
+    Runs the crew tasks for several stages through the Batch API.
+    
+    Every run's task is submitted in one batch. Like the real-time path, each
+    task uses structured outputs.
+    
+    Args:
+        runs: Stage and stage-specific parameters for each run
+        max_wait: Seconds to wait before cancelling the batch (see wait_for_batch)
+    
+    Returns:
+        List[Optional[Union[List[Dict], Dict]]]: Result of each run, in order
+            (None if the model refused, ran out of tokens or its output did not validate)
+    """
+    run_tasks = [create_crew_task(stage, **kwargs) for stage, kwargs in runs]
+    requests = [
+        {
+            "custom_id": f"run-{run}",
+            "body": {
+                "messages": build_task_messages(task),
+                **batch_completion_params(
+                    model=STAGE_MODELS.get(stage, MODEL),
+                    max_tokens=STAGE_MAX_TOKENS.get(stage, MAX_TOKENS)
+                ),
+                "response_format": response_format_param(STAGE_RESPONSE_MODELS[stage])
+            }
+        }
+        for run, ((stage, _), task) in enumerate(zip(runs, run_tasks))
+        if task is not None
+    ]
+    outputs = wait_for_batch(submit_batch(requests), max_wait) if requests else {}
+    
+    results = []
+    for run, ((stage, _), task) in enumerate(zip(runs, run_tasks)):
+        if task is None:
+            results.append(None)
+            continue
+        if f"run-{run}" not in outputs:
+            raise RuntimeError("Batch finished without a response for every task")
+        if outputs[f"run-{run}"] is None:
+            results.append(None)
+            continue
+        try:
+            parsed = STAGE_RESPONSE_MODELS[stage].model_validate_json(outputs[f"run-{run}"])
+            results.append(unwrap_structured_output(parsed))
+        except ValidationError:
+            results.append(None)
+    return results
+
+def run_stage_batch(stage: Stage, **kwargs) -> Optional[Union[List[Dict], Dict]]:
+    """
+    Runs the crew tasks for a stage through the Batch API.
+    
+    Args:
+        stage: Current stage of dinner planning
+        **kwargs: Stage-specific parameters
+    
+    Returns:
+        Optional[Union[List[Dict], Dict]]: Suggestions, or the menu analysis for the DESSERT stage
+    """
+    return run_stages_batch([(stage, kwargs)])[0]
+
+# Wine Name Matching
+MIN_ABBREVIATION_LENGTH = 3  # Shortest word taken as an abbreviation, e.g. "cab"
+
+def _wine_tokens(wine: str) -> List[str]:
+    """
+    Splits a wine name into lowercase words without accents.
+    
+    Args:
+        wine: Wine as typed by the user
+    
+    Returns:
+        List[str]: Words and numbers in the name, e.g. ["2018", "napa", "cabernet"]
+    """
+    decomposed = unicodedata.normalize("NFKD", wine.lower())
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return re.findall(r"[a-z]+|\d+", stripped)
+
+def _tokens_match(a: str, b: str) -> bool:
+    """
+    Tells whether two words name the same thing, allowing one to abbreviate the other.
+    
+    Args:
+        a: Word from one name
+        b: Word from the other name
+    
+    Returns:
+        bool: True if the words are equal, or one is a prefix of the other;
+            numbers such as vintages must be equal
+    """
+    if a == b:
+        return True
+    shorter, longer = sorted((a, b), key=len)
+    return (
+        shorter.isalpha()
+        and len(shorter) >= MIN_ABBREVIATION_LENGTH
+        and longer.startswith(shorter)
+    )
+
+def wine_names_match(a: str, b: str) -> bool:
+    """
+    Checks that two wine names share every grape, region, producer and vintage.
+    
+    Embeddings place "2018 Napa Cabernet" and "2021 Sonoma Cabernet" close
+    together, so the semantic cache also requires every word of each name to
+    match a word of the other. Abbreviations still match ("cab sauv" and
+    "Cabernet Sauvignon"), as do case and accents ("Rosé" and "rose").
+    
+    Args:
+        a: Wine being looked up
+        b: Stored wine
+    
+    Returns:
+        bool: True if neither name has a word the other lacks
+    """
+    tokens_a, tokens_b = _wine_tokens(a), _wine_tokens(b)
+    if not tokens_a or not tokens_b:
+        return False
+    return (
+        all(any(_tokens_match(x, y) for y in tokens_b) for x in tokens_a)
+        and all(any(_tokens_match(y, x) for x in tokens_a) for y in tokens_b)
+    )
@@ -0,0 +1,77 @@
+"""
+Cache Warmer for the Dinner Party Planner
+
+Precomputes entree suggestions for the wines users ask about most, so the
+first click for any of them is answered instantly. All wines are submitted
+together through the Batch API and the results are written to
+cache_warm.json, which the app consults before calling the crew.
+
+Usage (from the repository root):
+    python -m scripts.warm_cache
+
+Environment Variables:
+    OPENAI_API_KEY: Required for the Batch API
+"""
+
+import logging
+import sys
+
+import orjson
+from dotenv import load_dotenv
+from planner_core import Stage, WARM_CACHE_PATH, run_stages_batch
+
+logger = logging.getLogger(__name__)
+
+TOP_WINES = [
+    "Cabernet Sauvignon",
+    "Pinot Noir",
+    "Chardonnay",
+    "Sauvignon Blanc",
+    "Merlot",
+    "Malbec",
+    "Syrah",
+    "Zinfandel",
+    "Riesling",
+    "Pinot Grigio",
+    "Prosecco",
+    "Champagne",
+    "Rosé",
+    "Tempranillo",
+    "Sangiovese",
+    "Chianti",
+    "Grenache",
+    "Moscato",
+    "Chenin Blanc",
+    "Port",
+]
+
+def main():
+    """
+    Warms the cache for every wine in TOP_WINES.
+    
+    Wines whose suggestions fail validation are left out, so the app falls
+    back to asking the crew for them.
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    load_dotenv()
+    
+    # Nobody is waiting on the page, so let the batch use its whole completion window
+    results = run_stages_batch([(Stage.WINE, {"wine": wine}) for wine in TOP_WINES], max_wait=None)
+    
+    warm = {}
+    for wine, suggestions in zip(TOP_WINES, results):
+        if suggestions:
+            warm[wine] = suggestions
+        else:
+            logger.warning("Skipping %s: no valid suggestions", wine)
+    
+    with open(WARM_CACHE_PATH, "wb") as f:
+        f.write(orjson.dumps(warm, option=orjson.OPT_INDENT_2))
+    logger.info("Wrote suggestions for %d wines to %s", len(warm), WARM_CACHE_PATH)
+
+if __name__ == "__main__":
+    main()
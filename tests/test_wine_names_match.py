@@ -0,0 +1,43 @@
+"""
+Tests for the wine name check that guards the semantic cache.
+
+Run from the repository root with:
+    python -m pytest tests
+"""
+
+import pytest
+
+from planner_core import wine_names_match
+
+# Pairs whose embeddings are close but which are different wines
+NEAR_MISSES = [
+    ("2018 Napa Cabernet", "2021 Sonoma Cabernet"),
+    ("2018 Caymus Cabernet", "2019 Caymus Cabernet"),
+    ("Napa Cabernet", "Sonoma Cabernet"),
+    ("Pinot Noir", "Pinot Grigio"),
+    ("Sauvignon Blanc", "Cabernet Sauvignon"),
+    ("Cabernet Sauvignon", "Cabernet Franc"),
+    ("Chablis", "Chablis Premier Cru"),
+]
+
+# Differently written names for the same wine
+SAME_WINES = [
+    ("cab sauv", "Cabernet Sauvignon"),
+    ("Rosé", "rose"),
+    ("Caymus Cabernet Sauvignon 2018", "2018 caymus cab sauv"),
+    ("Châteauneuf-du-Pape", "chateauneuf du pape"),
+]
+
+@pytest.mark.parametrize("a, b", NEAR_MISSES)
+def test_near_misses_do_not_match(a, b):
+    assert not wine_names_match(a, b)
+    assert not wine_names_match(b, a)
+
+@pytest.mark.parametrize("a, b", SAME_WINES)
+def test_rewordings_match(a, b):
+    assert wine_names_match(a, b)
+    assert wine_names_match(b, a)
+
+def test_names_without_words_never_match():
+    assert not wine_names_match("", "")
+    assert not wine_names_match("!!", "Merlot")
@@ -0,0 +1,253 @@
+"""
+Shared pieces of the wine analysis mini apps.
+
+mini_app_no_crewai.py and mini_app_crewai.py differ only in the system prompt
+they send; the analysis model, the OpenAI calls, the caches and the Streamlit
+page live here, so the WineAnalysis schema is built once per process.
+"""
+import time
+from typing import Callable, Dict, Iterator
+import httpx
+import streamlit as st
+from pydantic import BaseModel, ConfigDict, Field
+from pydantic_core import from_json
+from openai import DefaultHttpxClient, OpenAI, pydantic_function_tool
+import logging
+import sys
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger(__name__)
+
+STREAM_RENDER_INTERVAL = 0.05  # Seconds between redraws of a streamed analysis
+ANALYSIS_CACHE_SIZE = 256  # Distinct wines whose analyses are kept in memory
+OPENAI_MAX_RETRIES = 3  # Retries, with exponential backoff, on connection errors, 429s and 5xx responses
+OPENAI_TIMEOUT = httpx.Timeout(20.0, connect=5.0)  # Fail fast on a stuck connection instead of waiting 10 minutes
+# Keep connections to the OpenAI API open between analyses
+CONNECTION_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60)
+
+# Model settings for the analysis; a short analysis needs neither a large model nor a long reply
+MODEL_CONFIG = {
+    "model": "gpt-4o-mini",
+    "max_tokens": 400,
+    "temperature": 0.2,
+}
+
+# Headings for each WineAnalysis field, in display order
+ANALYSIS_SECTIONS = {
+    "characteristics": "### 🍷 Characteristics",
+    "pairing_suggestions": "### 🍽️ Food Pairing Suggestions",
+    "serving_recommendations": "### 🥂 Serving Recommendations",
+}
+
+class WineAnalysis(BaseModel):
+    """
+    Represents the analysis of a selected wine.
+    """
+    characteristics: str = Field(
+        ...,
+        description="Detailed description of the wine's characteristics including aroma, taste, body, and finish"
+    )
+    pairing_suggestions: str = Field(
+        ...,
+        description="Specific food pairing suggestions that complement this wine"
+    )
+    serving_recommendations: str = Field(
+        ...,
+        description="Recommendations for serving temperature, decanting, and glass type"
+    )
+
+    # Frozen because cached analyses are shared between sessions
+    model_config = ConfigDict(frozen=True)
+
+# Strict tool definition for the analysis, built once from the model's schema, so the
+# API only produces arguments that match WineAnalysis
+WINE_TOOLS = [pydantic_function_tool(
+    WineAnalysis,
+    name="analyze_wine",
+    description="Analyze a wine and provide structured information"
+)]
+
+@st.cache_resource(show_spinner=False)
+def get_openai_client() -> OpenAI:
+    """Create the OpenAI client once, so its connection pool is reused across calls and reruns."""
+    return OpenAI(
+        max_retries=OPENAI_MAX_RETRIES,
+        timeout=OPENAI_TIMEOUT,
+        http_client=DefaultHttpxClient(limits=CONNECTION_LIMITS),
+    )
+
+def build_request(wine: str, system_prompt: str) -> Dict:
+    """Build the chat completion request for a wine."""
+    return {
+        **MODEL_CONFIG,
+        "messages": [{
+            "role": "system",
+            "content": system_prompt
+        }, {
+            "role": "user",
+            "content": f"Analyze this wine: {wine}"
+        }],
+        "tools": WINE_TOOLS,
+        "tool_choice": {"type": "function", "function": {"name": "analyze_wine"}}
+    }
+
+def stream_wine_arguments(wine: str, system_prompt: str) -> Iterator[str]:
+    """Analyze a wine, yielding the tool call arguments as they arrive."""
+    logger.info("Starting streamed wine analysis for: %s", wine)
+
+    response = get_openai_client().chat.completions.create(**build_request(wine, system_prompt), stream=True)
+    for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.tool_calls:
+            yield chunk.choices[0].delta.tool_calls[0].function.arguments or ""
+
+@st.cache_resource(show_spinner=False)
+def get_analysis_cache(cache_name: str) -> Dict[str, WineAnalysis]:
+    """Analyses already made by one app, keyed by normalized wine name and shared by every session."""
+    return {}
+
+def render_partial_analysis(placeholder, arguments: str) -> None:
+    """Show the analysis fields written so far in the streamed tool call arguments."""
+    try:
+        partial = from_json(arguments, allow_partial="trailing-strings")
+    except ValueError:
+        return  # Not enough of the arguments has arrived yet
+    sections = [
+        f"{heading}\n\n{partial[field]}"
+        for field, heading in ANALYSIS_SECTIONS.items()
+        if isinstance(partial, dict) and partial.get(field)
+    ]
+    if sections:
+        placeholder.markdown("\n\n".join(sections))
+
+def format_analysis(analysis: WineAnalysis) -> str:
+    """
+    Builds the markdown for a finished analysis.
+
+    Args:
+        analysis: Analysis to format
+
+    Returns:
+        str: The three analysis sections as one markdown string
+    """
+    return "\n\n".join(
+        f"{heading}\n\n{getattr(analysis, field)}"
+        for field, heading in ANALYSIS_SECTIONS.items()
+    )
+
+def render_analysis(analysis: WineAnalysis) -> None:
+    """Show the analysis results."""
+    st.subheader("Wine Analysis Results")
+    # One markdown element instead of a heading and a paragraph per section
+    st.markdown(format_analysis(analysis))
+
+def get_wine_analysis(wine: str, system_prompt: str, on_partial: Callable[[str], None]) -> WineAnalysis:
+    """
+    Gets wine analysis from the AI agent.
+
+    Args:
+        wine: Wine to analyze
+        system_prompt: System message that sets the analyst's voice
+        on_partial: Callback given the tool call arguments received so far, as they stream in
+
+    Returns:
+        The validated wine analysis
+    """
+    logger.info("Getting wine analysis for: %s", wine)
+
+    try:
+        # Get the analysis result, passing it on as it streams in
+        result_str = ""
+        last_render = 0.0
+        for fragment in stream_wine_arguments(wine, system_prompt):
+            result_str += fragment
+            # Redraw on a timer rather than for every token
+            if time.monotonic() - last_render >= STREAM_RENDER_INTERVAL:
+                on_partial(result_str)
+                last_render = time.monotonic()
+        logger.debug("Raw result from wine analysis: %s", result_str)
+
+        # Parse and validate the result in one pass; malformed JSON raises a ValidationError
+        analysis = WineAnalysis.model_validate_json(result_str)
+        logger.info("Successfully validated wine analysis")
+        return analysis
+
+    except Exception as e:
+        logger.error("Error analyzing wine: %s", e, exc_info=True)
+        raise Exception(f"Error analyzing wine: {str(e)}")
+
+def main(get_system_prompt: Callable[[], str], cache_name: str):
+    """
+    Draws the wine analysis page.
+
+    Args:
+        get_system_prompt: Returns the system message that sets the analyst's voice;
+            only called when a wine has to be analyzed, so its setup stays off the first page draw
+        cache_name: Names the app's own analysis cache; the system prompt shapes every
+            analysis, so apps with different prompts must not share one
+    """
+    st.title("🍷 Wine Analysis Assistant")
+    st.write("""
+    Enter a wine name below to get a detailed analysis, including characteristics,
+    food pairings, and serving recommendations.
+    """)
+
+    # Initialize session state for wine analysis if not exists
+    if 'wine_analysis' not in st.session_state:
+        st.session_state.wine_analysis = None
+
+    # Add Start Over button at the top
+    if st.button("Start Over"):
+        logger.info("Resetting application state")
+        st.session_state.wine_analysis = None
+        st.session_state.wine_input = ""  # Clear the input field
+        st.rerun()  # Rerun the app to reset the UI
+        return
+
+    # Wine input
+    wine_input = st.text_input(
+        "Enter a wine (e.g., '2018 Caymus Cabernet Sauvignon')",
+        key="wine_input"
+    )
+
+    # Analyze button
+    if st.button("Analyze Wine") and wine_input:
+        logger.info("Processing wine input: %s", wine_input)
+        try:
+            # Normalize so "Caymus " and "caymus" share one cached analysis
+            cache_key = wine_input.strip().lower()
+            cache = get_analysis_cache(cache_name)
+            if cache_key in cache:
+                logger.info("Analysis cache hit for: %s", cache_key)
+                analysis = cache[cache_key]
+            else:
+                with st.spinner("Analyzing wine..."):
+                    # Show the analysis as it is written, then hand over to the full display below
+                    placeholder = st.empty()
+                    # The model gets the name as typed, since case can matter (producers, "AOC")
+                    analysis = get_wine_analysis(
+                        wine_input,
+                        get_system_prompt(),
+                        on_partial=lambda arguments: render_partial_analysis(placeholder, arguments)
+                    )
+                    placeholder.empty()
+                # Remember the analysis, dropping the oldest once the cache is full
+                cache[cache_key] = analysis
+                if len(cache) > ANALYSIS_CACHE_SIZE:
+                    cache.pop(next(iter(cache)))
+            st.session_state.wine_analysis = analysis
+            logger.info("Successfully stored wine analysis in session state")
+        except Exception as e:
+            logger.error("Error in main: %s", e, exc_info=True)
+            st.error(f"Error analyzing wine: {str(e)}")
+            return
+
+    # Display results if available
+    if st.session_state.wine_analysis:
+        render_analysis(st.session_state.wine_analysis)